@@ -1,11 +1,37 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
+import os
+import threading
 import cv2
 import numpy as np
 from werkzeug.utils import secure_filename
-from script import process_image, solve  # Assuming script.py is in the same directory
+from script import process_and_repair_image, solve, solve_grid  # Assuming script.py is in the same directory
+from services.image_processing.digit_recognition.tools import load_model
+from services.image_processing.stream_tracker import StreamSession
+from services.solver.hints import find_hint
+from services.solver.session import SolvingSession
+from services.solver.candidates import find_conflicts
+from services.solver.grid_io import GRID_BYTES, decode_grids, encode_grids
+from services.session_store import SessionStore
+from services.profiler import profile_request
+from services.warmup import warm_up
 
 app = Flask(__name__)
 
+# Live camera stream sessions and incremental solving sessions, dropped after 5 minutes unused
+# or when the least recently used has to make room
+stream_sessions = SessionStore(ttl=300, max_sessions=1000)
+solving_sessions = SessionStore(ttl=300, max_sessions=10000)
+
+# Most grids accepted in one binary /solve request
+MAX_BINARY_GRIDS = 1000
+
+# Digit recognition model shared by every request, set once warm-up has finished
+model = None
+model_lock = threading.Lock()
+ready = threading.Event()
+# Process that started warm-up, a worker forked after import starts its own
+warm_up_pid = None
+
 def allowed_file(filename):
     """
     Check if the file extension is allowed.
@@ -34,6 +60,7 @@ def read_image(file):
 
 
 @app.route('/upload', methods=['POST'])
+@profile_request
 def process_sudoku():
     if 'file' not in request.files:
         return jsonify({"error": "No file part"}), 400
@@ -44,32 +71,333 @@ def process_sudoku():
 
     try:
         img = read_image(file)
-        sudoku_grid = process_image(img)
-        grid_list = sudoku_grid.tolist()
-        return jsonify({"sudokuGrid": grid_list}), 200
+        # Misread digits that leave the grid unsolvable are swapped for the model's next best reading
+        sudoku_grid, repaired_cells = process_and_repair_image(img, model=get_model())
+        # A solving session for later cell edits is only kept if the client asks for one
+        session_id = None
+        if request.values.get('session') in ('1', 'true'):
+            session_id = solving_sessions.create(SolvingSession(sudoku_grid))
+        response_type = negotiate_grid_type('application/json')
+        if response_type in GRID_BYTES:
+            # Binary bodies only hold the grid, the repairs go in a header as row,col,from,to entries
+            repaired = ';'.join(f"{cell['row']},{cell['col']},{cell['from']},{cell['to']}" for cell in repaired_cells)
+            headers = {'X-Repaired-Cells': repaired}
+            if session_id is not None:
+                headers['X-Session-ID'] = session_id
+            return grid_response(sudoku_grid, response_type, headers)
+        response = {"sudokuGrid": sudoku_grid.tolist(), "repairedCells": repaired_cells}
+        if session_id is not None:
+            response["sessionId"] = session_id
+        return jsonify(response), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 
 @app.route('/solve', methods=['POST'])
+@profile_request
 def solve_sudoku():
+    if request.mimetype in GRID_BYTES:
+        return solve_binary_grids()
+
     data = request.get_json()
     if not data or 'sudokuGrid' not in data:
         return jsonify({"error": "No sudoku grid provided"}), 400
 
-    sudoku_grid = np.array(data['sudokuGrid'])
-    
     try:
+        # A ragged list of rows fails here with a ValueError, like any other malformed grid
+        sudoku_grid = np.array(data['sudokuGrid'])
+        # Later edits to a 9x9 grid can go through a session instead of re-posting it, if one is asked for
+        session = None
+        if data.get('session') is True and sudoku_grid.shape == (9, 9):
+            session = SolvingSession(sudoku_grid)
+        # The 9x9 backtracking solver does not check the givens, a conflicting grid would keep it searching
+        if sudoku_grid.shape == (9, 9) and find_conflicts(sudoku_grid.ravel().tolist()):
+            raise ValueError("The grid has conflicting digits")
         solved_sudoku = solve(sudoku_grid)
-        solved_sudoku_list = solved_sudoku.tolist()
-        return jsonify({"solvedSudoku": solved_sudoku_list}), 200
+        headers = {}
+        if session is not None:
+            session.solution = [int(value) for value in solved_sudoku.flat]
+            headers['X-Session-ID'] = solving_sessions.create(session)
+
+        response_type = negotiate_grid_type('application/json') if sudoku_grid.shape == (9, 9) else 'application/json'
+        if response_type in GRID_BYTES:
+            return grid_response(solved_sudoku, response_type, headers)
+        response = {"solvedSudoku": solved_sudoku.tolist()}
+        if session is not None:
+            response["sessionId"] = headers['X-Session-ID']
+        return jsonify(response), 200
+    except ValueError:
+        return jsonify({"error": "Could not solve sudoku"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def solve_binary_grids():
+    """
+    Solve one or more grids posted in a binary grid format, for clients sending many grids.
+
+    The solutions are returned back to back in the format negotiated from the Accept header, the
+    request's format by default. A grid that cannot be solved, including one whose givens already
+    conflict, comes back as all zeros and its index is listed in the X-Unsolved-Grids header. At
+    most MAX_BINARY_GRIDS grids are accepted per request. No solving sessions are created.
+
+    Returns:
+    flask.Response: The solved grids, or a JSON error if the body is not a valid list of grids.
+    """
+    max_bytes = MAX_BINARY_GRIDS * GRID_BYTES[request.mimetype]
+    if request.content_length is not None and request.content_length > max_bytes:
+        return jsonify({"error": f"At most {MAX_BINARY_GRIDS} grids can be solved per request"}), 413
+
+    data = request.get_data(cache=False)
+    if len(data) > max_bytes:
+        return jsonify({"error": f"At most {MAX_BINARY_GRIDS} grids can be solved per request"}), 413
+    try:
+        grids = decode_grids(data, request.mimetype)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    solutions = np.zeros(grids.shape, dtype=np.uint8)
+    unsolved = []
+    for index, grid in enumerate(grids):
+        # The backtracking solver does not check the givens, a conflicting grid would keep it searching
+        if find_conflicts(grid.ravel().tolist()):
+            unsolved.append(index)
+            continue
+        try:
+            # The decoded grids can be a read-only view of the request body, the solver works on a copy
+            solutions[index] = solve_grid(grid.astype(int))
+        except ValueError:
+            unsolved.append(index)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    headers = {'X-Unsolved-Grids': ','.join(map(str, unsolved))} if unsolved else {}
+    return grid_response(solutions, negotiate_grid_type(request.mimetype), headers)
+
+
+@app.route('/hint', methods=['POST'])
+def hint_sudoku():
+    data = request.get_json()
+    if not data or 'sudokuGrid' not in data:
+        return jsonify({"error": "No sudoku grid provided"}), 400
+
+    try:
+        hint = find_hint(data['sudokuGrid'])
+        return jsonify({"hint": hint}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+
+def get_model():
+    """
+    Get the digit recognition model, loading it if a request arrives before warm-up has finished.
+
+    Returns:
+    torch.nn.Module: The loaded model in evaluation mode.
+    """
+    global model
+    if model is None:
+        # Requests arriving together before warm-up is done load the model only once
+        with model_lock:
+            if model is None:
+                model = load_model()
+    return model
+
+
+def negotiate_grid_type(default):
+    """
+    Pick the response format for grids from the request's Accept header.
+
+    Parameters:
+    default (str): Media type used when the client accepts anything or sent no Accept header.
+
+    Returns:
+    str: 'application/json' or one of the binary grid media types.
+    """
+    offered = [default] + [media_type for media_type in ('application/json', *GRID_BYTES) if media_type != default]
+    return request.accept_mimetypes.best_match(offered) or default
+
+
+def grid_response(grids, media_type, headers=None):
+    """
+    Build a response holding 9x9 grids in a binary grid format, or in JSON as a list of grids.
+
+    Parameters:
+    grids (numpy.ndarray): A 9x9 grid or an array of 9x9 grids.
+    media_type (str): The negotiated media type.
+    headers (dict, optional): Extra response headers.
+
+    Returns:
+    flask.Response: The response.
+    """
+    if media_type not in GRID_BYTES:
+        grids = np.asarray(grids).reshape(-1, 9, 9)
+        response = jsonify({"solvedSudoku": grids.tolist() if len(grids) > 1 else grids[0].tolist()})
+    else:
+        response = Response(encode_grids(grids, media_type), mimetype=media_type)
+    response.headers.update(headers or {})
+    response.headers['Vary'] = 'Accept'
+    return response
+
+
+def start_warm_up():
+    """
+    Warm the worker up on a background thread, after which /ready reports it ready for traffic.
+
+    Warm-up runs once per process. It is started when the app is imported, so it runs under any
+    WSGI or ASGI server, and again before the first request of a worker forked after that.
+    """
+    global warm_up_pid
+    with model_lock:
+        if warm_up_pid == os.getpid() or ready.is_set():
+            return
+        warm_up_pid = os.getpid()
+
+    def run():
+        global model
+        try:
+            warmed_model = warm_up()
+            with model_lock:
+                model = warmed_model
+            ready.set()
+        except Exception:
+            app.logger.exception("Warm-up failed, the worker will not report ready")
+
+    # Not a daemon, a process exiting during warm-up waits for it rather than aborting inside torch
+    threading.Thread(target=run, name='warm-up').start()
+
+
+@app.before_request
+def ensure_warm_up():
+    start_warm_up()
+
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({"status": "ok"}), 200
+
+
+@app.route('/ready', methods=['GET'])
+def readiness():
+    if not ready.is_set():
+        return jsonify({"ready": False}), 503
+    return jsonify({"ready": True}), 200
+
+
+@app.route('/stream', methods=['POST'])
+def start_stream():
+    session_id = stream_sessions.create(StreamSession(get_model()))
+    return jsonify({"sessionId": session_id}), 201
+
+
+@app.route('/stream/<session_id>/frame', methods=['POST'])
+def stream_frame(session_id):
+    entry = stream_sessions.get(session_id)
+    if entry is None:
+        return jsonify({"error": "Unknown or expired stream session"}), 404
+    session, session_lock = entry
+
+    if 'file' not in request.files:
+        return jsonify({"error": "No file part"}), 400
+
+    file = request.files['file']
+    if file.filename == '' or not allowed_file(file.filename):
+        return jsonify({"error": "No selected file or invalid file format"}), 400
+
+    try:
+        img = read_image(file)
+        # Frames of one session depend on each other, so they are processed one at a time
+        with session_lock:
+            result = session.process_frame(img)
+        return jsonify({
+            "sudokuGrid": result['grid'].tolist(),
+            "found": result['found'],
+            "tracked": result['tracked'],
+            "updatedCells": result['updatedCells'],
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/stream/<session_id>', methods=['DELETE'])
+def end_stream(session_id):
+    if not stream_sessions.delete(session_id):
+        return jsonify({"error": "Unknown or expired stream session"}), 404
+    return '', 204
+
+
+@app.route('/session', methods=['POST'])
+def start_session():
+    data = request.get_json()
+    if not data or 'sudokuGrid' not in data:
+        return jsonify({"error": "No sudoku grid provided"}), 400
+
+    try:
+        session_id = solving_sessions.create(SolvingSession(np.array(data['sudokuGrid'])))
+        return jsonify({"sessionId": session_id}), 201
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/session/<session_id>', methods=['PATCH'])
+def edit_session(session_id):
+    entry = solving_sessions.get(session_id)
+    if entry is None:
+        return jsonify({"error": "Unknown or expired session"}), 404
+    session, session_lock = entry
+
+    data = request.get_json()
+    if not data or not all(key in data for key in ('row', 'col', 'value')):
+        return jsonify({"error": "Cell row, col and value must be provided"}), 400
+
+    try:
+        with session_lock:
+            session.set_cell(int(data['row']), int(data['col']), int(data['value']))
+            conflicts = session.conflicts()
+            valid = session.is_valid()
+        return jsonify({
+            "valid": valid,
+            "conflicts": [[pos // 9, pos % 9] for pos in conflicts],
+        }), 200
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/session/<session_id>/solve', methods=['POST'])
+def solve_session(session_id):
+    entry = solving_sessions.get(session_id)
+    if entry is None:
+        return jsonify({"error": "Unknown or expired session"}), 404
+    session, session_lock = entry
+
+    try:
+        with session_lock:
+            solved_sudoku = session.solve()
+        return jsonify({"solvedSudoku": solved_sudoku.tolist()}), 200
     except ValueError:
         return jsonify({"error": "Could not solve sudoku"}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/session/<session_id>', methods=['DELETE'])
+def end_session(session_id):
+    if not solving_sessions.delete(session_id):
+        return jsonify({"error": "Unknown or expired session"}), 404
+    return '', 204
+
+
+
+start_warm_up()
+
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,190 @@
+# This script serves the api over ASGI, so slow clients do not each hold a worker thread
+import argparse
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from app import app as flask_app, start_warm_up
+
+# Largest request body accepted, bigger uploads are rejected before reaching the app
+MAX_BODY_SIZE = 16 * 1024 * 1024
+# Number of threads running the image processing and solving, the CPU count if unset
+THREADS_ENV = 'SUDOKU_ASGI_THREADS'
+
+
+def create_asgi_app(wsgi_app, max_workers=None, max_body_size=MAX_BODY_SIZE, on_startup=None):
+    """
+    Wrap the Flask app in an ASGI application that offloads request handling to a bounded thread pool.
+
+    The request body is received on the event loop, so a client uploading a photo over a slow mobile
+    connection only costs a coroutine. Once the whole body has arrived the request is handed to the
+    Flask app, and with it `process_image` and `solve`, on a pool of `max_workers` threads. Every
+    route therefore keeps exactly the same JSON contract as the Flask server.
+
+    The thread pool is created when the server starts, so the number of threads can still be set
+    through SUDOKU_ASGI_THREADS after the application is built.
+
+    Parameters:
+    - wsgi_app (callable): The WSGI application, the Flask app from app.py.
+    - max_workers (int, optional): Number of threads running the CPU bound stages, defaults to
+      SUDOKU_ASGI_THREADS or else the number of CPUs.
+    - max_body_size (int): Largest request body in bytes, larger requests get a 413 response.
+    - on_startup (callable, optional): Called when the server starts, before it accepts requests.
+
+    Returns:
+    - callable: The ASGI application.
+    """
+    executors = []
+
+    def get_executor():
+        # Every call runs on the event loop thread, so the pool is only ever created once
+        if not executors:
+            threads = max_workers or int(os.environ.get(THREADS_ENV) or 0) or os.cpu_count()
+            executors.append(ThreadPoolExecutor(max_workers=threads, thread_name_prefix='sudoku'))
+        return executors[0]
+
+    async def application(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await handle_lifespan(receive, send, get_executor, on_startup)
+            return
+        if scope['type'] != 'http':
+            return
+
+        body = io.BytesIO()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.write(message.get('body', b''))
+            if body.tell() > max_body_size:
+                await send_response(send, 413, [(b'content-type', b'application/json')],
+                                    b'{"error": "Request body too large"}')
+                return
+            if not message.get('more_body', False):
+                break
+
+        environ = build_environ(scope, body.getvalue())
+        loop = asyncio.get_running_loop()
+        status, headers, response_body = await loop.run_in_executor(get_executor(), call_wsgi, wsgi_app, environ)
+        await send_response(send, status, headers, response_body)
+
+    return application
+
+
+async def handle_lifespan(receive, send, get_executor, on_startup=None):
+    """
+    Answer the ASGI lifespan protocol, running the startup hook and shutting the thread pool down with the server.
+    """
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            get_executor()
+            if on_startup is not None:
+                on_startup()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            get_executor().shutdown(wait=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def send_response(send, status, headers, body):
+    """
+    Send a complete HTTP response.
+
+    Parameters:
+    - send (callable): The ASGI send channel.
+    - status (int): HTTP status code.
+    - headers (list of tuple of bytes): Response headers.
+    - body (bytes): Response body.
+    """
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def build_environ(scope, body):
+    """
+    Build a WSGI environ from an ASGI http scope and the full request body.
+
+    Parameters:
+    - scope (dict): The ASGI connection scope.
+    - body (bytes): The request body.
+
+    Returns:
+    - dict: The WSGI environ.
+    """
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def call_wsgi(wsgi_app, environ):
+    """
+    Run a WSGI application to completion, on a worker thread.
+
+    Parameters:
+    - wsgi_app (callable): The WSGI application.
+    - environ (dict): The WSGI environ.
+
+    Returns:
+    - tuple: (status code, list of header tuples as bytes, response body bytes)
+    """
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                for name, value in headers]
+
+    result = wsgi_app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+    return response['status'], response['headers'], body
+
+
+application = create_asgi_app(flask_app, on_startup=start_warm_up)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the sudoku api over ASGI.")
+    parser.add_argument('--host', default='0.0.0.0', help="Interface to listen on.")
+    parser.add_argument('--port', type=int, default=8000, help="Port to listen on.")
+    parser.add_argument('--threads', type=int, default=None,
+                        help="Threads running the image processing and solving, defaults to the CPU count.")
+    args = parser.parse_args()
+
+    if args.threads:
+        os.environ[THREADS_ENV] = str(args.threads)
+    uvicorn.run(application, host=args.host, port=args.port)
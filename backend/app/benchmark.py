@@ -0,0 +1,393 @@
+# This script benchmarks the full sudoku pipeline, from image bytes to a solved grid, stage by stage
+import argparse
+import glob
+import json
+import logging
+import os
+import resource
+import sys
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from services.image_processing.image_preprocessor import isolate_sudoku
+from services.image_processing.cell_configurator import extract_all_cells, construct_sudoku_grid
+from services.image_processing.cell_preprocessor import preprocess_and_select_cells, cell_buffer, find_candidate_cells
+from services.image_processing.digit_recognition.tools import predict_cell_digits, load_model
+from services.solver.sudoku_solver import solver
+from services.solver.generic_solver import generic_solver
+from services.solver.grid_io import load_grids
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+
+DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+DEFAULT_IMAGE_DIRECTORY = os.path.join(DATA_DIRECTORY, 'sudoku_tests')
+DEFAULT_GRID_CORPUS = os.path.join(DATA_DIRECTORY, 'sudoku_grids', 'corpus.txt')
+IMAGE_EXTENSIONS = ('png', 'jpg', 'jpeg')
+
+PIPELINE_STAGES = [
+    'decode',
+    'isolate_sudoku',
+    'extract_all_cells',
+    'find_candidate_cells',
+    'preprocess_and_select_cells',
+    'predict_cell_digits',
+    'solve',
+]
+CORPUS_STAGE = 'solve_corpus'
+
+
+def find_images(image_directory):
+    """
+    Find every image in a directory that the pipeline can process.
+
+    Parameters:
+     - image_directory (str): Directory containing sudoku images.
+
+    Returns:
+     - list of str: Sorted paths of the images found.
+    """
+    paths = []
+    for extension in IMAGE_EXTENSIONS:
+        paths.extend(glob.glob(os.path.join(image_directory, f'*.{extension}')))
+    return sorted(paths)
+
+
+def measure(func, *args, trace_memory=False):
+    """
+    Run a function once, timing it and optionally recording its peak traced memory.
+
+    Parameters:
+     - func (callable): The function to run.
+     - args: Positional arguments passed to func.
+     - trace_memory (bool): If True, tracemalloc must be running and the peak memory allocated
+       while func runs is returned.
+
+    Returns:
+     - tuple: (result of func, elapsed seconds, peak bytes or None)
+    """
+    if trace_memory:
+        tracemalloc.reset_peak()
+        start_memory, _ = tracemalloc.get_traced_memory()
+
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+
+    peak = None
+    if trace_memory:
+        _, peak_memory = tracemalloc.get_traced_memory()
+        peak = max(peak_memory - start_memory, 0)
+
+    return result, elapsed, peak
+
+
+def run_pipeline(image_bytes, model, samples, trace_memory=False):
+    """
+    Push one encoded image through every pipeline stage, recording a sample for each stage.
+
+    Parameters:
+     - image_bytes (bytes): The encoded image, as received by the /upload endpoint.
+     - model (torch.nn.Module): The loaded digit recognition model.
+     - samples (dict): Maps stage name to a dict of 'times' and 'peaks' lists, appended to in place.
+     - trace_memory (bool): Whether to record peak memory for each stage.
+
+    Returns:
+     - bool: True if the recognised grid was solved, False otherwise.
+    """
+    def record(stage, func, *args):
+        result, elapsed, peak = measure(func, *args, trace_memory=trace_memory)
+        samples[stage]['times'].append(elapsed)
+        if peak is not None:
+            samples[stage]['peaks'].append(peak)
+        return result
+
+    image = record('decode', lambda data: cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR),
+                   image_bytes)
+    transformed_image = record('isolate_sudoku', isolate_sudoku, image)
+    cells = record('extract_all_cells', extract_all_cells, transformed_image)
+    candidate_cells = record('find_candidate_cells', find_candidate_cells, transformed_image)
+    filled_cells, filled_positions = record('preprocess_and_select_cells', preprocess_and_select_cells, cells,
+                                              cell_buffer(), candidate_cells)
+    predictions = record('predict_cell_digits', predict_cell_digits, model, filled_cells)
+    grid = construct_sudoku_grid(predictions, filled_positions)
+    return record('solve', solver, grid)
+
+
+def run_benchmark(image_paths, grids, repeat=5):
+    """
+    Benchmark the pipeline over a set of images and the solver over a corpus of grids.
+
+    Each image and grid is first run once with tracemalloc enabled to record peak memory, then
+    `repeat` more times without tracing to collect timings that are not skewed by the tracer.
+
+    Parameters:
+     - image_paths (list of str): Paths of the images to push through the pipeline.
+     - grids (list of numpy.ndarray): Grids to solve directly.
+     - repeat (int): Number of timed runs per image and per grid.
+
+    Returns:
+     - dict: The benchmark report, ready to be written as JSON.
+    """
+    start = time.perf_counter()
+    model = load_model()
+    model_load_time = time.perf_counter() - start
+
+    encoded_images = []
+    for path in image_paths:
+        with open(path, 'rb') as f:
+            encoded_images.append((path, f.read()))
+
+    failures = {}
+
+    def run_all(samples, runs, trace_memory):
+        for _ in range(runs):
+            for path, image_bytes in encoded_images:
+                try:
+                    if not run_pipeline(image_bytes, model, samples, trace_memory):
+                        failures[os.path.basename(path)] = "Could not solve sudoku"
+                except Exception as e:
+                    failures[os.path.basename(path)] = str(e)
+            for grid in grids:
+                _, elapsed, peak = measure(solver, grid.copy(), trace_memory=trace_memory)
+                samples[CORPUS_STAGE]['times'].append(elapsed)
+                if peak is not None:
+                    samples[CORPUS_STAGE]['peaks'].append(peak)
+
+    # Memory pass, its timings are discarded as tracemalloc slows every allocation down
+    traced_samples = {stage: {'times': [], 'peaks': []} for stage in PIPELINE_STAGES + [CORPUS_STAGE]}
+    tracemalloc.start()
+    try:
+        run_all(traced_samples, 1, trace_memory=True)
+    finally:
+        tracemalloc.stop()
+
+    # Timing pass
+    samples = {stage: {'times': [], 'peaks': traced_samples[stage]['peaks']} for stage in traced_samples}
+    run_all(samples, repeat, trace_memory=False)
+
+    stages = {stage: summarise(stage_samples) for stage, stage_samples in samples.items()}
+
+    pipeline_time = sum(sum(samples[stage]['times']) for stage in PIPELINE_STAGES)
+    pipeline_runs = len(samples['decode']['times'])
+    corpus_time = sum(samples[CORPUS_STAGE]['times'])
+    corpus_runs = len(samples[CORPUS_STAGE]['times'])
+
+    return {
+        'images': [os.path.basename(path) for path in image_paths],
+        'grids': len(grids),
+        'repeat': repeat,
+        'model_load_ms': model_load_time * 1000,
+        'stages': stages,
+        'throughput': {
+            'images_per_second': pipeline_runs / pipeline_time if pipeline_time else None,
+            'grids_per_second': corpus_runs / corpus_time if corpus_time else None,
+        },
+        'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'failures': failures,
+    }
+
+
+def make_scaling_puzzle(box_size, empty_fraction, rng):
+    """
+    Make a random puzzle of any box size by shuffling a patterned solution and emptying cells.
+
+    Parameters:
+     - box_size (int): Side length of a box, the grid is box_size² cells wide.
+     - empty_fraction (float): Fraction of cells to empty.
+     - rng (numpy.random.Generator): Source of randomness.
+
+    Returns:
+     - numpy.ndarray: The puzzle, 0 for empty cells.
+    """
+    size = box_size * box_size
+
+    # Rows and columns may be shuffled within a band and bands shuffled as a whole, keeping the grid valid
+    def shuffled_lines():
+        bands = rng.permutation(box_size)
+        return [band * box_size + line for band in bands for line in rng.permutation(box_size)]
+
+    rows, cols, digits = shuffled_lines(), shuffled_lines(), rng.permutation(size) + 1
+    grid = np.array([[digits[(box_size * (r % box_size) + r // box_size + c) % size] for c in cols] for r in rows])
+
+    carved = rng.choice(size * size, size=int(empty_fraction * size * size), replace=False)
+    grid.flat[carved] = 0
+    return grid
+
+
+def run_scaling_benchmark(box_sizes=(2, 3, 4, 5), puzzles=5, empty_fraction=0.6, seed=0):
+    """
+    Benchmark solve time against board size with the generic bitset solver.
+
+    The 9x9 backtracking solver is timed on the same 9x9 puzzles for reference.
+
+    Parameters:
+     - box_sizes (iterable of int): Box sizes to benchmark, 3 for the classic 9x9 board.
+     - puzzles (int): Number of random puzzles per board size.
+     - empty_fraction (float): Fraction of cells emptied in each puzzle.
+     - seed (int): Seed for reproducible puzzles.
+
+    Returns:
+     - dict: The benchmark report, with one stage per solver and board size.
+    """
+    rng = np.random.default_rng(seed)
+    samples = {}
+    failures = {}
+    for box_size in box_sizes:
+        size = box_size * box_size
+        stage = f'generic_solver_{size}x{size}'
+        samples[stage] = {'times': [], 'peaks': []}
+        if box_size == 3:
+            samples['solver_9x9'] = {'times': [], 'peaks': []}
+
+        for i in range(puzzles):
+            puzzle = make_scaling_puzzle(box_size, empty_fraction, rng)
+            solved, elapsed, _ = measure(generic_solver, puzzle.copy())
+            samples[stage]['times'].append(elapsed)
+            if not solved:
+                failures[f'{stage} puzzle {i}'] = "Could not solve sudoku"
+            if box_size == 3:
+                _, elapsed, _ = measure(solver, puzzle.copy())
+                samples['solver_9x9']['times'].append(elapsed)
+
+    return {
+        'scaling': True,
+        'puzzles': puzzles,
+        'empty_fraction': empty_fraction,
+        'stages': {stage: summarise(stage_samples) for stage, stage_samples in samples.items()},
+        'failures': failures,
+    }
+
+
+def summarise(stage_samples):
+    """
+    Summarise the samples collected for one stage.
+
+    Parameters:
+     - stage_samples (dict): The 'times' (seconds) and 'peaks' (bytes) recorded for the stage.
+
+    Returns:
+     - dict: Run count, mean and p95 time in milliseconds and peak traced memory in KiB.
+    """
+    times = np.array(stage_samples['times']) * 1000
+    peaks = stage_samples['peaks']
+    if times.size == 0:
+        return {'runs': 0, 'mean_ms': None, 'p95_ms': None, 'peak_kib': None}
+
+    return {
+        'runs': int(times.size),
+        'mean_ms': float(np.mean(times)),
+        'p95_ms': float(np.percentile(times, 95)),
+        'peak_kib': max(peaks) / 1024 if peaks else None,
+    }
+
+
+def compare(report, baseline, threshold):
+    """
+    Compare a benchmark report against a baseline report.
+
+    A stage regresses when its mean time grows by more than `threshold` percent over the
+    baseline. Stages missing from either report are ignored.
+
+    Parameters:
+     - report (dict): The current benchmark report.
+     - baseline (dict): A previously written benchmark report.
+     - threshold (float): Allowed slowdown per stage, in percent.
+
+    Returns:
+     - list of str: The names of the stages that regressed.
+    """
+    regressions = []
+    for stage, current in report['stages'].items():
+        previous = baseline.get('stages', {}).get(stage)
+        if not previous or not previous['mean_ms'] or current['mean_ms'] is None:
+            continue
+
+        change = (current['mean_ms'] - previous['mean_ms']) / previous['mean_ms'] * 100
+        status = 'REGRESSED' if change > threshold else 'ok'
+        logging.info(f"{stage:<28} {previous['mean_ms']:10.3f}ms -> {current['mean_ms']:10.3f}ms "
+                     f"({change:+.1f}%) {status}")
+        if change > threshold:
+            regressions.append(stage)
+
+    return regressions
+
+
+def log_report(report):
+    """
+    Log a human readable summary of a benchmark report.
+
+    Parameters:
+     - report (dict): The benchmark report.
+    """
+    logging.info(f"Benchmarked {len(report['images'])} images and {report['grids']} grids, "
+                 f"{report['repeat']} timed runs each (model load {report['model_load_ms']:.1f}ms)")
+    for stage, summary in report['stages'].items():
+        if summary['runs'] == 0:
+            continue
+        peak = f"{summary['peak_kib']:.1f}KiB" if summary['peak_kib'] is not None else 'n/a'
+        logging.info(f"{stage:<28} mean {summary['mean_ms']:10.3f}ms  p95 {summary['p95_ms']:10.3f}ms  "
+                     f"peak {peak}")
+    throughput = report['throughput']
+    logging.info(f"Throughput: {throughput['images_per_second'] or 0:.2f} images/s, "
+                 f"{throughput['grids_per_second'] or 0:.2f} grids/s, max RSS {report['max_rss_kib']}KiB")
+    for name, error in report['failures'].items():
+        logging.warning(f"{name} failed: {error}")
+
+
+def log_scaling_report(report):
+    """
+    Log a human readable summary of a scaling benchmark report.
+
+    Parameters:
+     - report (dict): The scaling benchmark report.
+    """
+    logging.info(f"Solved {report['puzzles']} puzzles per board size, "
+                 f"{report['empty_fraction']:.0%} of cells empty")
+    for stage, summary in report['stages'].items():
+        logging.info(f"{stage:<28} mean {summary['mean_ms']:10.3f}ms  p95 {summary['p95_ms']:10.3f}ms")
+    for name, error in report['failures'].items():
+        logging.warning(f"{name} failed: {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the sudoku image pipeline and solver.")
+    parser.add_argument('--images', default=DEFAULT_IMAGE_DIRECTORY, help="Directory of sudoku images.")
+    parser.add_argument('--grids', default=DEFAULT_GRID_CORPUS, help="Grid corpus file.")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per image and grid.")
+    parser.add_argument('--output', default='benchmark_results.json', help="Where to write the JSON report.")
+    parser.add_argument('--compare', metavar='BASELINE', help="Baseline JSON report to compare against.")
+    parser.add_argument('--threshold', type=float, default=20.0,
+                        help="Allowed mean slowdown per stage in percent before failing the comparison.")
+    parser.add_argument('--scaling', action='store_true',
+                        help="Benchmark solve time against board size (4x4 to 25x25) instead of the pipeline.")
+    parser.add_argument('--scaling-puzzles', type=int, default=5, help="Random puzzles per board size.")
+    parser.add_argument('--empty-fraction', type=float, default=0.6,
+                        help="Fraction of cells emptied in each scaling puzzle.")
+    args = parser.parse_args(argv)
+
+    if args.scaling:
+        report = run_scaling_benchmark(puzzles=args.scaling_puzzles, empty_fraction=args.empty_fraction)
+        log_scaling_report(report)
+    else:
+        report = run_benchmark(find_images(args.images), load_grids(args.grids), repeat=args.repeat)
+        log_report(report)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    logging.info(f"Report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            logging.error(f"Stages regressed by more than {args.threshold}%: {', '.join(regressions)}")
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,420 @@
+# This script load tests the api over HTTP, reporting latency percentiles, errors and the throughput it sustains
+import argparse
+import http.client
+import json
+import logging
+import os
+import queue
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+import numpy as np
+from benchmark import DEFAULT_IMAGE_DIRECTORY, DEFAULT_GRID_CORPUS, find_images
+from services.solver.grid_io import load_grids
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+
+SERVER_MODES = ('flask', 'asgi', 'inprocess')
+# Seconds allowed for a started server to load the model and report ready
+STARTUP_TIMEOUT = 120
+# Seconds before a single request counts as failed
+REQUEST_TIMEOUT = 30
+
+
+#  Main function
+def run_load_test(base_url, workload, rates, duration=10.0, concurrency=8, slo_ms=1000.0, max_error_rate=0.01,
+                  seed=0):
+    """
+    Replay the workload against a running server at each arrival rate in turn.
+
+    Requests are sent open loop: their start times are fixed in advance at `rate` per second, with
+    exponentially distributed gaps, and sent by `concurrency` connections. Latency is measured from
+    the scheduled start, so once the server falls behind the time requests spend waiting for a free
+    connection is counted too, instead of the load quietly dropping to what the server can take.
+    A rate of 0 runs closed loop instead, every connection sending its next request as soon as the
+    previous one is answered, which measures the peak throughput directly.
+
+    A rate is sustained if the server kept up with it (achieved at least 95% of the offered rate),
+    its p99 latency stayed within `slo_ms` and its error rate within `max_error_rate`.
+
+    Parameters:
+     - base_url (str): Address of the server, e.g. http://127.0.0.1:8000.
+     - workload (list of tuple): Requests to replay, from `build_workload`.
+     - rates (list of float): Arrival rates in requests per second, 0 for closed loop.
+     - duration (float): Seconds spent at each rate.
+     - concurrency (int): Number of connections sending requests.
+     - slo_ms (float): Largest acceptable p99 latency in milliseconds.
+     - max_error_rate (float): Largest acceptable fraction of failed requests.
+     - seed (int): Seed for the request order and arrival times.
+
+    Returns:
+     - dict: The settings, a summary for each rate and the highest sustained throughput.
+    """
+    rng = random.Random(seed)
+    stages = []
+    for rate in rates:
+        results, elapsed = run_stage(base_url, workload, rate, duration, concurrency, rng)
+        stage = summarise_stage(results, elapsed, rate)
+        stage['sustained'] = (stage['error_rate'] <= max_error_rate
+                              and stage['latency_ms']['p99'] is not None and stage['latency_ms']['p99'] <= slo_ms
+                              and (rate == 0 or stage['achieved_rps'] >= 0.95 * rate))
+        stages.append(stage)
+        log_stage(stage)
+
+    sustained = [stage['achieved_rps'] for stage in stages if stage['sustained']]
+    return {
+        'url': base_url,
+        'duration_s': duration,
+        'concurrency': concurrency,
+        'slo_ms': slo_ms,
+        'max_error_rate': max_error_rate,
+        'workload': {name: sum(1 for request in workload if request[0] == name) for name in ('/upload', '/solve')},
+        'stages': stages,
+        'max_sustained_rps': max(sustained) if sustained else None,
+    }
+
+
+# Supplementary functions
+def build_workload(image_paths, grids, upload_fraction=0.2, size=100, seed=0):
+    """
+    Build the request bodies to replay, a mix of photo uploads and grids to solve.
+
+    Parameters:
+     - image_paths (list of str): Sudoku photos posted to /upload.
+     - grids (list of numpy.ndarray): 9x9 grids posted to /solve.
+     - upload_fraction (float): Fraction of requests that are uploads.
+     - size (int): Number of requests in the workload, replayed in a cycle.
+     - seed (int): Seed for picking the photos and grids.
+
+    Returns:
+     - list of tuple: (path, content type, body bytes) for each request.
+
+    Raises:
+     - ValueError: If the mix needs photos or grids that were not given.
+    """
+    rng = random.Random(seed)
+    if upload_fraction > 0 and not image_paths:
+        raise ValueError("Uploads were requested but no images were found")
+    if upload_fraction < 1 and not grids:
+        raise ValueError("Solves were requested but no grids were found")
+
+    uploads = [encode_upload(path) for path in image_paths]
+    solves = [json.dumps({'sudokuGrid': grid.tolist()}).encode() for grid in grids]
+
+    workload = []
+    for _ in range(size):
+        if rng.random() < upload_fraction:
+            content_type, body = rng.choice(uploads)
+            workload.append(('/upload', content_type, body))
+        else:
+            workload.append(('/solve', 'application/json', rng.choice(solves)))
+    return workload
+
+
+def encode_upload(image_path):
+    """
+    Encode a photo as the multipart form body /upload expects.
+
+    Parameters:
+     - image_path (str): Path of the photo.
+
+    Returns:
+     - tuple: (content type with boundary, body bytes)
+    """
+    boundary = uuid.uuid4().hex
+    with open(image_path, 'rb') as f:
+        image_bytes = f.read()
+    body = (f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="file"; filename="{os.path.basename(image_path)}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n').encode() + image_bytes + f'\r\n--{boundary}--\r\n'.encode()
+    return f'multipart/form-data; boundary={boundary}', body
+
+
+def run_stage(base_url, workload, rate, duration, concurrency, rng):
+    """
+    Send requests at one arrival rate for `duration` seconds.
+
+    Parameters:
+     - base_url (str): Address of the server.
+     - workload (list of tuple): Requests to replay in a cycle.
+     - rate (float): Arrival rate in requests per second, 0 for closed loop.
+     - duration (float): Seconds to send requests for.
+     - concurrency (int): Number of connections.
+     - rng (random.Random): Source of the arrival times and request order.
+
+    Returns:
+     - tuple: (list of (path, status or None, latency seconds) results, elapsed seconds)
+    """
+    offset = rng.randrange(len(workload))
+    start = time.perf_counter() + 0.1
+    end = start + duration
+    schedule = queue.Queue()
+    if rate > 0:
+        scheduled = start
+        index = offset
+        while scheduled < end:
+            schedule.put((scheduled, workload[index % len(workload)]))
+            scheduled += rng.expovariate(rate)
+            index += 1
+
+    results = []
+    results_lock = threading.Lock()
+    counter = [offset]
+
+    def next_request():
+        if rate > 0:
+            try:
+                return schedule.get_nowait()
+            except queue.Empty:
+                return None
+        now = time.perf_counter()
+        if now >= end:
+            return None
+        with results_lock:
+            request = workload[counter[0] % len(workload)]
+            counter[0] += 1
+        return max(now, start), request
+
+    def send_requests():
+        connection = None
+        while True:
+            item = next_request()
+            if item is None:
+                break
+            scheduled, (path, content_type, body) = item
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif -delay > REQUEST_TIMEOUT:
+                # A client would have given up on a request that waited this long, so it is not sent
+                with results_lock:
+                    results.append((path, None, -delay))
+                continue
+            if connection is None:
+                connection = open_connection(base_url)
+            status = None
+            try:
+                connection.request('POST', path, body=body, headers={'Content-Type': content_type})
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = None
+            latency = time.perf_counter() - scheduled
+            with results_lock:
+                results.append((path, status, latency))
+        if connection is not None:
+            connection.close()
+
+    threads = [threading.Thread(target=send_requests, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, max(time.perf_counter() - start, duration)
+
+
+def open_connection(base_url):
+    """
+    Open a keep-alive HTTP connection to the server.
+
+    Parameters:
+     - base_url (str): Address of the server.
+
+    Returns:
+     - http.client.HTTPConnection: The connection.
+    """
+    url = urllib.parse.urlsplit(base_url)
+    connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+    return connection_class(url.hostname, url.port, timeout=REQUEST_TIMEOUT)
+
+
+def summarise_stage(results, elapsed, rate):
+    """
+    Summarise the results sent at one arrival rate, overall and per endpoint.
+
+    A request failed if it got no response or a status of 400 or above.
+
+    Parameters:
+     - results (list of tuple): (path, status or None, latency seconds) of each request.
+     - elapsed (float): Seconds from the first scheduled request to the last response.
+     - rate (float): The offered arrival rate, 0 for closed loop.
+
+    Returns:
+     - dict: Request and error counts, throughput, latency percentiles and status counts.
+    """
+    def summarise(selected):
+        latencies = np.array([latency for _, _, latency in selected]) * 1000
+        errors = sum(1 for _, status, _ in selected if status is None or status >= 400)
+        statuses = {}
+        for _, status, _ in selected:
+            key = str(status) if status is not None else 'no response'
+            statuses[key] = statuses.get(key, 0) + 1
+        latency = {name: None for name in ('mean', 'p50', 'p90', 'p99', 'max')}
+        if latencies.size:
+            latency = {
+                'mean': float(latencies.mean()),
+                'p50': float(np.percentile(latencies, 50)),
+                'p90': float(np.percentile(latencies, 90)),
+                'p99': float(np.percentile(latencies, 99)),
+                'max': float(latencies.max()),
+            }
+        return {
+            'requests': len(selected),
+            'errors': errors,
+            'error_rate': errors / len(selected) if selected else 0.0,
+            'latency_ms': latency,
+            'statuses': statuses,
+        }
+
+    summary = {'offered_rps': rate or None, 'achieved_rps': len(results) / elapsed}
+    summary.update(summarise(results))
+    summary['endpoints'] = {path: summarise([result for result in results if result[0] == path])
+                            for path in sorted({result[0] for result in results})}
+    return summary
+
+
+def start_server(mode, port, threads=None):
+    """
+    Start the api locally and wait until it reports ready.
+
+    The flask and asgi modes run the server in a subprocess, so the load generator does not share
+    its interpreter lock. The inprocess mode runs the Flask app on a thread of this process, which
+    is quicker to start but also slows the server down by the load generator's own work.
+
+    Parameters:
+     - mode (str): 'flask' for the threaded Flask server, 'asgi' for asgi.py or 'inprocess'.
+     - port (int): Port to listen on.
+     - threads (int, optional): Threads running requests in asgi mode, defaults to the CPU count.
+
+    Returns:
+     - tuple: (base url, function that stops the server)
+
+    Raises:
+     - RuntimeError: If the server does not report ready in time.
+    """
+    base_url = f'http://127.0.0.1:{port}'
+    app_directory = os.path.dirname(os.path.abspath(__file__))
+
+    if mode == 'inprocess':
+        from werkzeug.serving import make_server
+        from app import app  # Importing the app starts its warm-up
+        server = make_server('127.0.0.1', port, app, threaded=True)
+        threading.Thread(target=server.serve_forever, name='loadtest-server', daemon=True).start()
+        stop = server.shutdown
+    else:
+        if mode == 'flask':
+            command = [sys.executable, '-c', 'from app import app; '
+                       f'app.run(host="127.0.0.1", port={port}, threaded=True)']
+        else:
+            command = [sys.executable, 'asgi.py', '--host', '127.0.0.1', '--port', str(port)]
+            if threads:
+                command += ['--threads', str(threads)]
+        process = subprocess.Popen(command, cwd=app_directory, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        def stop():
+            process.terminate()
+            process.wait(timeout=30)
+
+    if not wait_until_ready(base_url):
+        stop()
+        raise RuntimeError(f"The {mode} server did not report ready within {STARTUP_TIMEOUT}s")
+    return base_url, stop
+
+
+def wait_until_ready(base_url, timeout=STARTUP_TIMEOUT):
+    """
+    Poll /ready until the server answers 200.
+
+    Parameters:
+     - base_url (str): Address of the server.
+     - timeout (float): Seconds to wait.
+
+    Returns:
+     - boolean: True if the server became ready in time.
+    """
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        connection = open_connection(base_url)
+        try:
+            connection.request('GET', '/ready')
+            if connection.getresponse().status == 200:
+                return True
+        except (OSError, http.client.HTTPException):
+            pass
+        finally:
+            connection.close()
+        time.sleep(0.2)
+    return False
+
+
+def log_stage(stage):
+    """
+    Log a human readable summary of one arrival rate.
+
+    Parameters:
+     - stage (dict): The stage summary from `summarise_stage`.
+    """
+    offered = f"{stage['offered_rps']:.1f} rps" if stage['offered_rps'] else 'closed loop'
+    latency = stage['latency_ms']
+    percentiles = (f"p50 {latency['p50']:8.1f}ms  p99 {latency['p99']:8.1f}ms"
+                   if latency['p50'] is not None else 'no responses')
+    logging.info(f"{offered:<12} achieved {stage['achieved_rps']:7.1f} rps  {percentiles}  "
+                 f"errors {stage['error_rate']:.1%}  {'sustained' if stage['sustained'] else 'NOT sustained'}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the sudoku api over HTTP.")
+    parser.add_argument('--server', choices=SERVER_MODES, default='flask',
+                        help="How to start the api locally, ignored when --url is given.")
+    parser.add_argument('--url', help="Load test an already running server instead of starting one.")
+    parser.add_argument('--port', type=int, default=8765, help="Port for the locally started server.")
+    parser.add_argument('--threads', type=int, default=None, help="Server threads in asgi mode.")
+    parser.add_argument('--images', default=DEFAULT_IMAGE_DIRECTORY, help="Directory of photos posted to /upload.")
+    parser.add_argument('--grids', default=DEFAULT_GRID_CORPUS, help="Grid corpus posted to /solve.")
+    parser.add_argument('--upload-fraction', type=float, default=0.2, help="Fraction of requests that are uploads.")
+    parser.add_argument('--rates', default='0',
+                        help="Comma separated arrival rates in requests per second, 0 runs closed loop.")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds spent at each rate.")
+    parser.add_argument('--concurrency', type=int, default=8, help="Connections sending requests.")
+    parser.add_argument('--slo-ms', type=float, default=1000.0, help="Largest acceptable p99 latency.")
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help="Largest acceptable error rate.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the request mix and arrival times.")
+    parser.add_argument('--output', default='loadtest_results.json', help="Where to write the JSON report.")
+    args = parser.parse_args(argv)
+
+    workload = build_workload(find_images(args.images), load_grids(args.grids), args.upload_fraction,
+                              seed=args.seed)
+    rates = [float(rate) for rate in args.rates.split(',')]
+
+    if args.url:
+        base_url, stop = args.url.rstrip('/'), None
+    else:
+        start = time.perf_counter()
+        base_url, stop = start_server(args.server, args.port, args.threads)
+        logging.info(f"Started {args.server} server in {time.perf_counter() - start:.1f}s")
+
+    try:
+        report = run_load_test(base_url, workload, rates, args.duration, args.concurrency, args.slo_ms,
+                               args.max_error_rate, args.seed)
+    finally:
+        if stop is not None:
+            stop()
+
+    report['server'] = 'external' if args.url else args.server
+    report['threads'] = args.threads
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    logging.info(f"Max sustained throughput {report['max_sustained_rps'] or 0:.1f} rps, "
+                 f"report written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
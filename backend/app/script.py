@@ -1,15 +1,31 @@
+import argparse
+import glob
+import json
 import logging
+import multiprocessing
+import os
+import threading
+import time
+import cv2
+import torch
 from services.image_processing.loader import load_image
 from services.image_processing.image_preprocessor import isolate_sudoku
 from services.image_processing.cell_configurator import extract_all_cells, construct_sudoku_grid
-from services.image_processing.cell_preprocessor import preprocess_and_select_cells
-from services.image_processing.digit_recognition.tools import predict_cell_digits, load_model
+from services.image_processing.cell_preprocessor import preprocess_and_select_cells, cell_buffer, find_candidate_cells
+from services.image_processing.digit_recognition.tools import predict_cell_digits, predict_cell_candidates, load_model
 from services.solver.sudoku_solver import solver
+from services.solver.generic_solver import generic_solver
+from services.solver.repair import repair_grid
+from services.solver.candidates import find_conflicts
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
 DEFAULT_IMAGE_PATH = '../data/sudoku_tests/sudoku_test2.png'
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# Model of a batch worker process, loaded once by `init_batch_worker`
+worker_model = None
 
 def load(path=DEFAULT_IMAGE_PATH):
     """
@@ -23,21 +39,21 @@ def load(path=DEFAULT_IMAGE_PATH):
     """
     return load_image(path)
 
-def process_image(image):
+def process_image(image, model=None):
     """
     Process the given image to extract sudoku grid in a format ready for solving.
 
     Parameters:
     image (numpy.ndarray): The image containing the sudoku puzzle.
+    model (torch.nn.Module, optional): The digit recognition model, loaded if not given.
 
     Returns:
     numpy.ndarray: 2D array representing the sudoku grid with digits.
     """
     try:
-        transformed_image = isolate_sudoku(image)
-        sudoku_cells = extract_all_cells(transformed_image)
-        filled_sudoku_cells, filled_cell_positions = preprocess_and_select_cells(sudoku_cells)
-        model = load_model()
+        filled_sudoku_cells, filled_cell_positions = extract_filled_cells(image)
+        if model is None:
+            model = load_model()
         predictions = predict_cell_digits(model, filled_sudoku_cells)
         grid = construct_sudoku_grid(predictions, filled_cell_positions)
         return grid
@@ -45,9 +61,68 @@ def process_image(image):
         logging.error(f"Error occurred during image processing: {e}", exc_info=True)
         raise
 
+def process_and_repair_image(image, model=None):
+    """
+    Process the given image like `process_image`, repairing misread digits if the grid cannot be solved.
+
+    The model's top 3 readings of each cell are kept, and if the recognised grid breaks the rules
+    or has no solution, the most probable alternative readings that give a uniquely solvable
+    grid are used instead.
+
+    Parameters:
+    image (numpy.ndarray): The image containing the sudoku puzzle.
+    model (torch.nn.Module, optional): The digit recognition model, loaded if not given.
+
+    Returns:
+    tuple: The 2D sudoku grid with digits, and a list of the cells that were repaired, each a dict
+    with 'row', 'col', 'from', 'to' and 'probability'.
+    """
+    try:
+        grid, repaired_cells = recognise_and_repair(image, model)
+        if repaired_cells:
+            logging.info(f"Repaired misread cells: {repaired_cells}")
+        return grid, repaired_cells
+    except Exception as e:
+        logging.error(f"Error occurred during image processing: {e}", exc_info=True)
+        raise
+
+def recognise_and_repair(image, model=None):
+    """
+    Recognise and repair the grid like `process_and_repair_image`, without logging, for callers that report errors themselves.
+
+    Parameters:
+    image (numpy.ndarray): The image containing the sudoku puzzle.
+    model (torch.nn.Module, optional): The digit recognition model, loaded if not given.
+
+    Returns:
+    tuple: The 2D sudoku grid with digits, and the list of repaired cells.
+    """
+    filled_sudoku_cells, filled_cell_positions = extract_filled_cells(image)
+    if model is None:
+        model = load_model()
+    digits, probabilities = predict_cell_candidates(model, filled_sudoku_cells, k=3)
+    grid = construct_sudoku_grid(digits[:, 0], filled_cell_positions)
+    return repair_grid(grid, filled_cell_positions, digits, probabilities)
+
+def extract_filled_cells(image):
+    """
+    Isolate the sudoku in the image and preprocess the cells that contain a digit.
+
+    Parameters:
+    image (numpy.ndarray): The image containing the sudoku puzzle.
+
+    Returns:
+    tuple: The preprocessed filled cells, ready for the model, and their positions in the grid.
+    """
+    transformed_image = isolate_sudoku(image)
+    sudoku_cells = extract_all_cells(transformed_image)
+    # Only cells with ink in their centre go through the full preprocessing
+    candidate_cells = find_candidate_cells(transformed_image)
+    return preprocess_and_select_cells(sudoku_cells, out=cell_buffer(), candidate_cells=candidate_cells)
+
 def solve(grid):
     """
-    Solve the given sudoku grid.
+    Solve the given sudoku grid. Grids other than 9x9 (4x4, 16x16, 25x25) use the generic solver.
 
     Parameters:
     grid (numpy.ndarray): 2D array representing the sudoku grid with digits.
@@ -56,14 +131,29 @@ def solve(grid):
     numpy.ndarray: Solved sudoku grid.
     """
     try:
-        if solver(grid):
-            return grid
-        else:
-            raise ValueError("Could not solve sudoku")
+        return solve_grid(grid)
     except Exception as e:
         logging.error(f"Error occurred during solving sudoku: {e}", exc_info=True)
         raise
 
+def solve_grid(grid):
+    """
+    Solve the given sudoku grid in place like `solve`, without logging.
+
+    Parameters:
+    grid (numpy.ndarray): 2D array representing the sudoku grid with digits.
+
+    Returns:
+    numpy.ndarray: Solved sudoku grid.
+
+    Raises:
+    ValueError: If the grid has no solution.
+    """
+    grid_solver = solver if grid.shape == (9, 9) else generic_solver
+    if not grid_solver(grid):
+        raise ValueError("Could not solve sudoku")
+    return grid
+
 def test_workflow():
     """
     Function to test the complete workflow from loading an image to solving the sudoku.
@@ -76,6 +166,138 @@ def test_workflow():
     except Exception as e:
         logging.error("Failed to complete the sudoku solving workflow.", exc_info=True)
 
+def find_image_paths(inputs):
+    """
+    Lazily list the image files named by directories, glob patterns or file paths.
+
+    Parameters:
+    inputs (list of str): Directories (searched recursively), glob patterns or image paths.
+
+    Yields:
+    str: The path of each image, in the order found.
+    """
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            for directory, _, file_names in os.walk(pattern):
+                for file_name in sorted(file_names):
+                    if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield os.path.join(directory, file_name)
+        else:
+            for path in glob.iglob(pattern, recursive=True):
+                if path.lower().endswith(IMAGE_EXTENSIONS):
+                    yield path
+
+def init_batch_worker():
+    """
+    Prepare a batch worker process, loading the model once for every image it handles.
+
+    Each worker runs torch and OpenCV single threaded, as the pool already uses every CPU.
+    """
+    global worker_model
+    torch.set_num_threads(1)
+    cv2.setNumThreads(1)
+    worker_model = load_model()
+
+def process_file(path):
+    """
+    Load, recognise and solve one image in a batch worker.
+
+    Parameters:
+    path (str): The path to the image file.
+
+    Returns:
+    dict: The JSONL record, with the 'path', recognised 'grid', 'repairedCells', 'solution',
+    'timings' in milliseconds per stage and 'error' (None on success). Stages after a failure
+    are left as None.
+    """
+    record = {'path': path, 'grid': None, 'repairedCells': None, 'solution': None, 'timings': {}, 'error': None}
+    start = time.perf_counter()
+    try:
+        image = load(path)
+        if image is None:
+            raise ValueError("Could not decode image")
+        record['timings']['load_ms'] = (time.perf_counter() - start) * 1000
+
+        stage_start = time.perf_counter()
+        # Failures are reported in the record, the logging variants would print a traceback per image
+        grid, repaired_cells = recognise_and_repair(image, model=worker_model)
+        record['timings']['process_ms'] = (time.perf_counter() - stage_start) * 1000
+        record['grid'] = grid.tolist()
+        record['repairedCells'] = repaired_cells
+
+        # The backtracking solver does not check the givens, a grid repair could not fix would keep it searching
+        conflicts = find_conflicts(grid.ravel().tolist())
+        if conflicts:
+            raise ValueError(f"Recognised grid has conflicting digits at {[[pos // 9, pos % 9] for pos in conflicts]}")
+
+        stage_start = time.perf_counter()
+        record['solution'] = solve_grid(grid).tolist()
+        record['timings']['solve_ms'] = (time.perf_counter() - stage_start) * 1000
+    except Exception as e:
+        record['error'] = f"{type(e).__name__}: {e}"
+    record['timings']['total_ms'] = (time.perf_counter() - start) * 1000
+    return record
+
+def run_batch(inputs, output_file, workers=None, max_in_flight=256):
+    """
+    Recognise and solve every image named by the inputs across a process pool, writing results as JSONL.
+
+    Paths are listed lazily and each is submitted to the pool on its own, with at most
+    `max_in_flight` images submitted but not yet written, so the listing is never read up front and
+    a slow image only holds up its own worker. Each worker reads its own images, so only file names
+    pass through the main process and memory does not grow with the number of images. Records are
+    written and flushed in the order images finish, as soon as they finish.
+
+    Parameters:
+    inputs (list of str): Directories, glob patterns or image paths.
+    output_file (str): Path of the JSONL file, one record per image as from `process_file`.
+    workers (int, optional): Number of worker processes, defaults to the number of CPUs.
+    max_in_flight (int): Most images submitted to the pool ahead of the records written.
+
+    Returns:
+    dict: Counts of 'images' processed, 'solved' and 'failed'.
+    """
+    counts = {'images': 0, 'solved': 0, 'failed': 0}
+    in_flight = threading.BoundedSemaphore(max_in_flight)
+    with multiprocessing.Pool(workers, initializer=init_batch_worker) as pool, open(output_file, 'w') as f:
+        # Results arrive one at a time on the pool's result thread, which writes them and frees their slot
+        def write_record(record):
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            counts['images'] += 1
+            counts['solved' if record['error'] is None else 'failed'] += 1
+            if counts['images'] % 100 == 0:
+                logging.info(f"Processed {counts['images']} images ({counts['failed']} failed)")
+            in_flight.release()
+
+        for path in find_image_paths(inputs):
+            in_flight.acquire()
+            pool.apply_async(process_file, (path,), callback=write_record,
+                             error_callback=lambda e, path=path: write_record(
+                                 {'path': path, 'grid': None, 'repairedCells': None, 'solution': None,
+                                  'timings': {}, 'error': f"{type(e).__name__}: {e}"}))
+        pool.close()
+        pool.join()
+
+    return counts
+
 
 if __name__ == '__main__':
-    test_workflow()
+    parser = argparse.ArgumentParser(description="Recognise and solve sudoku images. Without inputs, runs the "
+                                                 "workflow on the default test image.")
+    parser.add_argument('inputs', nargs='*', help="Image directories, glob patterns or image files.")
+    parser.add_argument('--output', default='results.jsonl', help="JSONL file to write one record per image to.")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes, defaults to CPU count.")
+    parser.add_argument('--max-in-flight', type=int, default=256,
+                        help="Most images handed to the workers ahead of the records written.")
+    args = parser.parse_args()
+
+    if not args.inputs:
+        test_workflow()
+    else:
+        start = time.perf_counter()
+        counts = run_batch(args.inputs, args.output, workers=args.workers, max_in_flight=args.max_in_flight)
+        elapsed = time.perf_counter() - start
+        logging.info(f"Wrote {counts['images']} records to {args.output} in {elapsed:.1f}s "
+                     f"({counts['solved']} solved, {counts['failed']} failed, "
+                     f"{counts['images'] / max(elapsed, 1e-9):.1f} images/s)")
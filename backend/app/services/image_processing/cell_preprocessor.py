@@ -1,9 +1,39 @@
 import cv2
+import functools
+import threading
 import numpy as np
 import os
 
+# Shape of the batch the digit recognition model takes, one 28x28 image per sudoku cell
+CELL_BUFFER_SHAPE = (81, 28, 28)
 
-def preprocess_and_select_cells(cells):
+# Per thread model input buffers, see `cell_buffer`
+_thread_buffers = threading.local()
+
+# Share of ink in a cell's centre below which `find_candidate_cells` treats the cell as empty. Well
+# under the 10% `is_filled` asks for, so the pre-pass only skips cells that are clearly blank.
+EMPTY_INK_RATIO = 0.05
+
+
+def cell_buffer():
+    """
+    Get the calling thread's preallocated buffer for preprocessed cells.
+
+    The buffer is allocated once per worker thread and reused for every image, so preprocessing
+    writes straight into the array that becomes the model input. Its contents are only valid
+    until the same thread processes the next image.
+
+    Returns:
+    - numpy.ndarray: A float32 array of shape (81, 28, 28).
+    """
+    buffer = getattr(_thread_buffers, 'cells', None)
+    if buffer is None:
+        buffer = np.empty(CELL_BUFFER_SHAPE, dtype=np.float32)
+        _thread_buffers.cells = buffer
+    return buffer
+
+
+def preprocess_and_select_cells(cells, out=None, candidate_cells=None):
     """
     Process and filter a batch of Sudoku cell images to be ready for digit prediction.
 
@@ -15,10 +45,16 @@ def preprocess_and_select_cells(cells):
 
     Parameters:
     - cells (list of numpy.ndarray): A list of cell images represented as 3D (RGB) NumPy arrays.
+    - out (numpy.ndarray, optional): A float32 buffer of shape (len(cells), 28, 28), such as
+      `cell_buffer()`. If given, the selected cells are written into its first rows and processed
+      in uint8/float32 without intermediate float64 copies.
+    - candidate_cells (numpy.ndarray, optional): A boolean array with one entry per cell, such as
+      `find_candidate_cells()`. Cells marked False are skipped as empty without being preprocessed.
 
     Returns:
     - tuple of (list of numpy.ndarray, list of int):
-        - selected_cells: A list of NumPy arrays representing the preprocessed cell images that contain digits.
+        - selected_cells: A list of NumPy arrays representing the preprocessed cell images that contain digits,
+          or the filled rows of 'out' if it was given.
         - indices: A list of integers indicating the original positions of the selected cells in the input list.
 
     Raises:
@@ -33,9 +69,20 @@ def preprocess_and_select_cells(cells):
     if not cells or not isinstance(cells, list):  
         raise ValueError("cells must be a non-empty list of images")
 
+    if out is not None:
+        indices = []
+        for i, cell in enumerate(cells):
+            if candidate_cells is not None and not candidate_cells[i]:
+                continue
+            if preprocess_sudoku_cell(cell, out=out[len(indices)]) is not None:
+                indices.append(i)
+        return out[:len(indices)], indices
+
     selected_cells = []
     indices = []
     for i, cell in enumerate(cells):
+        if candidate_cells is not None and not candidate_cells[i]:
+            continue
         preprocessed_cell = preprocess_sudoku_cell(cell)
         if preprocessed_cell is not None:
             selected_cells.append(preprocessed_cell)
@@ -46,7 +93,7 @@ def preprocess_and_select_cells(cells):
 
 
 
-def preprocess_sudoku_cell(cell_image): 
+def preprocess_sudoku_cell(cell_image, out=None):
     """    
     Preprocess a Sudoku cell image for digit recognition.
 
@@ -62,10 +109,13 @@ def preprocess_sudoku_cell(cell_image):
 
     Parameters:
     - cell_image (numpy.ndarray): An RGB image of a Sudoku cell.
+    - out (numpy.ndarray, optional): A float32 28x28 array to write the result into. If given,
+      the image stays uint8 until the final lookup from `normalisation_table`, which produces the
+      same values as the float64 histogram matching and normalisation.
 
     Returns:
-    - numpy.ndarray or None: A 28x28 pixel preprocessed image of a Sudoku cell if a digit is
-      detected, or None if the cell is empty.
+    - numpy.ndarray or None: A 28x28 pixel preprocessed image of a Sudoku cell (which is 'out' if
+      given) if a digit is detected, or None if the cell is empty.
 
     Preconditions:
     - is_filled(cell_image): A function that determines if the cell contains a digit.
@@ -85,8 +135,11 @@ def preprocess_sudoku_cell(cell_image):
 
     # Remove outliers, could be caused by lighting effects
     # Calculate the percentiles and set limits 
-    percentile_min = np.percentile(cell_image, 2)
-    percentile_max = np.percentile(cell_image, 98)
+    if out is None:
+        percentile_min = np.percentile(cell_image, 2)
+        percentile_max = np.percentile(cell_image, 98)
+    else:
+        percentile_min, percentile_max = uint8_percentiles(cell_image, (2, 98))
     cell_image[cell_image < percentile_min] = percentile_min
     cell_image[cell_image > percentile_max] = percentile_max
   
@@ -107,6 +160,11 @@ def preprocess_sudoku_cell(cell_image):
         # Resize image
         cell_image = cv2.resize(cell_image, (28, 28))
 
+        if out is not None:
+            # Every step left maps each grey level to one value, so apply them as a table
+            np.take(normalisation_table(cell_image), cell_image, out=out)
+            return out
+
         # Match histograms
         cell_image = match_histogram(cell_image)
 
@@ -122,6 +180,112 @@ def preprocess_sudoku_cell(cell_image):
 
 
 
+def find_candidate_cells(board_image, padding_amount=0.1):
+    """
+    Find the cells of a warped Sudoku board that may contain a digit, in one pass over the board.
+
+    The board is thresholded once with a local mean threshold, which copes with uneven lighting,
+    and an integral image of the ink is built from it. The amount of ink in the centre region of
+    every cell, the same region `is_filled` looks at, is then read from the integral image for all
+    81 cells at once. Cells with almost no ink are empty and do not need the full preprocessing.
+
+    Parameters:
+    - board_image (numpy.ndarray): The perspective-transformed Sudoku board image (BGR).
+    - padding_amount (float): The cell padding fraction used by `extract_all_cells`.
+
+    Returns:
+    - numpy.ndarray: A boolean array of 81 values, in the order of `extract_all_cells`, False for
+      cells that are certainly empty.
+    """
+    gray = cv2.cvtColor(board_image, cv2.COLOR_BGR2GRAY)
+    cell_height = board_image.shape[0] // 9
+    cell_width = board_image.shape[1] // 9
+
+    # Dark pixels well below the mean of a cell sized neighbourhood are ink
+    block_size = max(3, cell_height // 2 * 2 + 1)
+    ink = cv2.adaptiveThreshold(gray, 1, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, block_size, 10)
+    integral = cv2.integral(ink)
+
+    # Centre region bounds of every cell, matching the cropping in extract_all_cells and is_filled
+    inner_height = cell_height - 2 * int(cell_height * padding_amount)
+    inner_width = cell_width - 2 * int(cell_width * padding_amount)
+    top = np.arange(9) * cell_height + int(cell_height * padding_amount)
+    left = np.arange(9) * cell_width + int(cell_width * padding_amount)
+    y0, y1 = top + int(inner_height * 0.30), top + int(inner_height * 0.70)
+    x0, x1 = left + int(inner_width * 0.30), left + int(inner_width * 0.70)
+
+    ink_pixels = (integral[y1[:, None], x1] - integral[y0[:, None], x1]
+                  - integral[y1[:, None], x0] + integral[y0[:, None], x0])
+    ink_ratio = ink_pixels / ((y1 - y0)[:, None] * (x1 - x0))
+
+    return (ink_ratio >= EMPTY_INK_RATIO).ravel()
+
+
+
+def uint8_percentiles(image, percentiles):
+    """
+    Compute percentiles of a uint8 image from its histogram, without sorting a float64 copy.
+
+    The values match `np.percentile` with its default linear interpolation.
+
+    Parameters:
+    - image (numpy.ndarray): A uint8 image.
+    - percentiles (tuple of float): The percentiles to compute, between 0 and 100.
+
+    Returns:
+    - list of float: The percentile values.
+    """
+    cumulative_counts = np.cumsum(cv2.calcHist([image], [0], None, [256], [0, 256]).ravel())
+    last_index = image.size - 1
+
+    values = []
+    for percentile in percentiles:
+        virtual_index = last_index * (np.float64(percentile) / 100)
+        lower_index = int(np.floor(virtual_index))
+        upper_index = min(lower_index + 1, last_index)
+        # The sorted value at index i is the first grey level with more than i pixels at or below it
+        lower, upper = np.searchsorted(cumulative_counts, [lower_index, upper_index], side='right')
+        fraction = virtual_index - lower_index
+        difference = float(upper) - float(lower)
+        if fraction >= 0.5:
+            values.append(upper - difference * (1 - fraction))
+        else:
+            values.append(lower + difference * fraction)
+    return values
+
+
+
+def normalisation_table(cell_image, reference_hist_dir="mnist_average_histogram.npy"):
+    """
+    Build a lookup table applying `match_histogram` and the MNIST normalisation to a uint8 image.
+
+    Both steps only depend on a pixel's grey level and on the image's histogram, so they are
+    computed once for each of the 256 levels rather than for every pixel. The table holds the
+    exact float64 results rounded to float32, as the model input would be.
+
+    Parameters:
+    - cell_image (numpy.ndarray): The uint8 28x28 cell image.
+    - reference_hist_dir (str): Path to the .npy file containing the reference histogram.
+
+    Returns:
+    - numpy.ndarray: A float32 array of 256 values, indexed by grey level.
+    """
+    counts = cv2.calcHist([cell_image], [0], None, [256], [0, 256]).ravel()
+    present_levels = np.flatnonzero(counts)
+    reference_cdf = load_reference_cdf(reference_hist_dir)
+
+    source = np.arange(256) / present_levels[-1]
+    source_hist, bin_edges = np.histogram(source, bins=256, range=[0, 256], weights=counts)
+    mapping = np.interp(np.cumsum(source_hist), reference_cdf, bin_edges[:-1])
+    matched = np.interp(source, bin_edges[:-1], mapping)
+
+    lowest, highest = matched[present_levels[0]], matched[present_levels[-1]]
+    table = (matched - lowest) / (highest - lowest)
+    table = (table / table[present_levels].max() - 0.5) / 0.5
+    return table.astype(np.float32)
+
+
+
 def is_filled(cell_image):
     """
     Determine whether a Sudoku cell contains a digit.
@@ -268,17 +432,8 @@ def match_histogram(source, reference_hist_dir="mnist_average_histogram.npy"):
     - The matching is done based on the cumulative distribution function (CDF) of pixel intensities.
     """
 
-     # Load MNIST histogram
-    directory = os.path.dirname(os.path.abspath(__file__))
-    mnist_hist_path = os.path.join(directory, reference_hist_dir)
-        
-    try:
-        mnist_average_hist = np.load(mnist_hist_path)
-    except IOError:
-        raise IOError("Histogram file not found.")
-
     # Match histogramns
-    reference_cdf = np.cumsum(mnist_average_hist)
+    reference_cdf = load_reference_cdf(reference_hist_dir)
     source = source / np.max(source)  # Histogram must be between 0 and 1 
     source_hist, bin_edges = np.histogram(source.flatten(), bins=256, range=[0, 256])
     source_cdf = np.cumsum(source_hist)
@@ -288,4 +443,33 @@ def match_histogram(source, reference_hist_dir="mnist_average_histogram.npy"):
 
     cell = matched.reshape(source.shape)
 
-    return cell
\ No newline at end of file
+    return cell
+
+
+
+@functools.lru_cache(maxsize=None)
+def load_reference_cdf(reference_hist_dir="mnist_average_histogram.npy"):
+    """
+    Load the reference histogram and return its cumulative distribution, cached after the first call.
+
+    Parameters:
+    - reference_hist_dir (str): Path to the .npy file containing the reference histogram, relative
+      to this module.
+
+    Returns:
+    - numpy.ndarray: The cumulative reference histogram.
+
+    Raises:
+    - IOError: If the reference histogram file cannot be found.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    mnist_hist_path = os.path.join(directory, reference_hist_dir)
+
+    try:
+        mnist_average_hist = np.load(mnist_hist_path)
+    except IOError:
+        raise IOError("Histogram file not found.")
+
+    reference_cdf = np.cumsum(mnist_average_hist)
+    reference_cdf.flags.writeable = False
+    return reference_cdf
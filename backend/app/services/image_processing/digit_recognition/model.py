@@ -81,4 +81,38 @@ class sudokuCNN(nn.Module):
         # Output layer with log softmax activation
         x = F.log_softmax(self.fc4(x), dim=1)
         
-        return x
\ No newline at end of file
+        return x
+
+class sudokuStudentCNN(nn.Module):
+    # Small model distilled from sudokuCNN (see trainmodel.py --distill), for CPU-bound deployments.
+    # Printed digits 1-9 need far less capacity than handwritten MNIST, two narrow 3x3 convolutions and
+    # one small dense layer take around 30x fewer multiply-adds per cell.
+    def __init__(self):
+        super(sudokuStudentCNN, self).__init__()
+
+        # Layer 1: Convolutional layer with Batch Normalization and Max Pooling, 28x28 -> 14x14
+        self.conv1 = nn.Conv2d(in_channels=1, out_channels=16, kernel_size=3, stride=1, padding=1, bias=False)
+        self.bn1 = nn.BatchNorm2d(16)
+        self.pool1 = nn.MaxPool2d(kernel_size=2, stride=2)
+
+        # Layer 2: Convolutional layer with Batch Normalization and Max Pooling, 14x14 -> 7x7
+        self.conv2 = nn.Conv2d(in_channels=16, out_channels=32, kernel_size=3, stride=1, padding=1, bias=False)
+        self.bn2 = nn.BatchNorm2d(32)
+        self.pool2 = nn.MaxPool2d(kernel_size=2, stride=2)
+        self.dropout = nn.Dropout(0.25)
+
+        # Layer 3: Fully connected layer with Batch Normalization
+        self.fc1 = nn.Linear(32 * 7 * 7, 64, bias=False)
+        self.bn3 = nn.BatchNorm1d(64)
+
+        # Layer 4: Output layer with 9 units for digits 1-9
+        self.fc2 = nn.Linear(64, 9)
+
+    def forward(self, x):
+        x = self.pool1(F.relu(self.bn1(self.conv1(x))))
+        x = self.pool2(F.relu(self.bn2(self.conv2(x))))
+        x = x.flatten(1)
+        x = self.dropout(F.relu(self.bn3(self.fc1(x))))
+
+        # Output layer with log softmax activation, like sudokuCNN
+        return F.log_softmax(self.fc2(x), dim=1)
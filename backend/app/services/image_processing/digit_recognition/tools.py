@@ -1,12 +1,32 @@
-from .model import sudokuCNN
+from .model import sudokuCNN, sudokuStudentCNN
 # from ..histogram_matching import load_histogram, match_histogram
+import json
 import os
+import tempfile
 import torch
 import cv2
 import numpy as np
 
+# Architectures load_model can build, with the default file name of their state dictionary
+MODEL_ARCHITECTURES = {
+    'cnn': (sudokuCNN, 'sudoku_cnn_state_dict.pth'),
+    'student': (sudokuStudentCNN, 'sudoku_student_state_dict.pth'),
+}
+# Set to 'student' to serve the small distilled model instead of sudokuCNN
+MODEL_ENV = 'SUDOKU_MODEL'
 
-def load_model(model_path=None):
+# Set to 1 to have every process map the model weights from one shared file instead of loading a copy
+MAPPED_WEIGHTS_ENV = 'SUDOKU_MAPPED_WEIGHTS'
+
+# Directory the flat weight files are written to. By default they go next to the state dictionary, or
+# to a directory in the system temp directory if that is not writable (as in the Docker image)
+WEIGHTS_CACHE_DIR_ENV = 'SUDOKU_WEIGHTS_CACHE_DIR'
+
+# Tensors in the flat weight file start on multiples of this many bytes
+WEIGHT_ALIGNMENT = 64
+
+
+def load_model(model_path=None, mapped=None, architecture=None):
     """
     Load a pre-trained Sudoku Convolutional Neural Network (CNN) model.
 
@@ -15,35 +35,221 @@ def load_model(model_path=None):
 
     Parameters:
     - model_path (str, optional): Path to the model's state dictionary file. If None, it defaults
-      to 'sudoku_cnn_state_dict.pth' in the same directory as this script.
+      to the architecture's file in the same directory as this script, 'sudoku_cnn_state_dict.pth'
+      for 'cnn'.
+    - mapped (bool, optional): Back the parameters with a memory-mapped flat weight file, see
+      `load_mapped_model`. If None, it is enabled by setting the SUDOKU_MAPPED_WEIGHTS
+      environment variable to 1.
+    - architecture (str, optional): 'cnn' for sudokuCNN or 'student' for the distilled
+      sudokuStudentCNN. If None, it is read from the SUDOKU_MODEL environment variable, 'cnn' by default.
 
     Returns:
     - torch.nn.Module: The loaded PyTorch model in evaluation mode.
 
     Raises:
     - FileNotFoundError: If the state dictionary file does not exist at the specified path.
+    - ValueError: If the architecture is not one of MODEL_ARCHITECTURES.
 
     Notes:
-    - The 'sudokuCNN()' function used to instantiate the model must be defined in the same scope
-      where 'load_model' is called.
-    - The state dictionary file is expected to be compatible with the 'sudokuCNN' model architecture.
+    - The state dictionary file is expected to be compatible with the chosen model architecture.
     """
+    if architecture is None:
+        architecture = os.environ.get(MODEL_ENV, 'cnn')
+    if architecture not in MODEL_ARCHITECTURES:
+        raise ValueError(f"Unknown model architecture {architecture!r}, expected one of {sorted(MODEL_ARCHITECTURES)}")
+    model_class, file_name = MODEL_ARCHITECTURES[architecture]
+
     if model_path is None:
         # Get the directory of the current file and append the default filename
         directory = os.path.dirname(os.path.abspath(__file__))
-        model_path = os.path.join(directory, "sudoku_cnn_state_dict.pth")
+        model_path = os.path.join(directory, file_name)
 
-    try:
-        state_dict = torch.load(model_path)
-    except FileNotFoundError:
-        raise FileNotFoundError(f"Model file not found at {model_path}")
+    if not os.path.exists(model_path):
+        message = f"Model file not found at {model_path}"
+        if architecture == 'student':
+            # The student's weights are not shipped, they are trained from sudokuCNN
+            message += (", train it from backend/app with "
+                        "python -m services.image_processing.digit_recognition.trainmodel --distill")
+        raise FileNotFoundError(message)
+
+    if mapped is None:
+        mapped = os.environ.get(MAPPED_WEIGHTS_ENV) == '1'
+    if mapped:
+        return load_mapped_model(model_path, architecture)
+
+    state_dict = torch.load(model_path)
 
-    model = sudokuCNN()
+    model = model_class()
     model.load_state_dict(state_dict)
     model.eval()
     return model
 
 
+def mapped_weights_paths(model_path, cache_directory=None):
+    """
+    Get the paths of the flat weight file, its index and their lock file for a state dictionary file.
+
+    Parameters:
+    - model_path (str): Path to the model's state dictionary file.
+    - cache_directory (str, optional): Directory of the files. If None, it is read from the
+      SUDOKU_WEIGHTS_CACHE_DIR environment variable, and otherwise the state dictionary's directory
+      is used if it is writable, or a 'sudoku-weights' directory in the system temp directory.
+
+    Returns:
+    - tuple of str: (weight file path, index file path, lock file path)
+    """
+    if cache_directory is None:
+        cache_directory = os.environ.get(WEIGHTS_CACHE_DIR_ENV)
+    if cache_directory is None:
+        cache_directory = os.path.dirname(os.path.abspath(model_path))
+        if not os.access(cache_directory, os.W_OK):
+            cache_directory = os.path.join(tempfile.gettempdir(), 'sudoku-weights')
+    os.makedirs(cache_directory, exist_ok=True)
+
+    base_path = os.path.join(cache_directory, os.path.splitext(os.path.basename(model_path))[0])
+    return base_path + ".weights", base_path + ".weights.json", base_path + ".weights.lock"
+
+
+def export_mapped_weights(model_path, cache_directory=None):
+    """
+    Convert a state dictionary into a flat weight file that can be memory-mapped.
+
+    Every tensor is written as raw bytes at an aligned offset of a single file, and a JSON index
+    records the name, dtype, shape and offset of each one, and the size of the whole file. Both
+    files are written to uniquely named temporary files and moved into place. Callers must hold
+    the exclusive lock on the lock file, as `load_mapped_model` does, so that processes starting
+    together export once and never see a weight file and index from different exports.
+
+    Parameters:
+    - model_path (str): Path to the model's state dictionary file.
+    - cache_directory (str, optional): Directory of the files, see `mapped_weights_paths`.
+
+    Returns:
+    - str: Path of the flat weight file.
+
+    Raises:
+    - FileNotFoundError: If the state dictionary file does not exist at the specified path.
+    """
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model file not found at {model_path}")
+
+    weights_path, index_path, _ = mapped_weights_paths(model_path, cache_directory)
+    directory = os.path.dirname(weights_path)
+    state_dict = torch.load(model_path, map_location='cpu')
+
+    index = []
+    offset = 0
+    weights_fd, weights_temp_path = tempfile.mkstemp(dir=directory, suffix='.weights.tmp')
+    index_fd, index_temp_path = tempfile.mkstemp(dir=directory, suffix='.weights.json.tmp')
+    try:
+        with os.fdopen(weights_fd, 'wb') as f:
+            for name, tensor in state_dict.items():
+                array = tensor.contiguous().numpy()
+                padding = -offset % WEIGHT_ALIGNMENT
+                f.write(b'\0' * padding)
+                offset += padding
+                index.append({'name': name, 'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset})
+                f.write(array.tobytes())
+                offset += array.nbytes
+
+        with os.fdopen(index_fd, 'w') as f:
+            json.dump({'source_mtime': os.path.getmtime(model_path), 'size': offset, 'tensors': index}, f)
+
+        # mkstemp creates the files readable by their owner only, other users may share the cache
+        os.chmod(weights_temp_path, 0o644)
+        os.chmod(index_temp_path, 0o644)
+        os.replace(weights_temp_path, weights_path)
+        os.replace(index_temp_path, index_path)
+    except BaseException:
+        for path in (weights_temp_path, index_temp_path):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    return weights_path
+
+
+def read_mapped_index(model_path, weights_path, index_path):
+    """
+    Read the index of a flat weight file, if the file is complete and up to date.
+
+    Parameters:
+    - model_path (str): Path to the model's state dictionary file.
+    - weights_path (str): Path of the flat weight file.
+    - index_path (str): Path of its index.
+
+    Returns:
+    - dict or None: The index, or None if either file is missing, unreadable, does not match the
+      other or is older than the state dictionary.
+    """
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+        if os.path.getsize(weights_path) != index['size']:
+            return None
+        if os.path.exists(model_path) and index['source_mtime'] != os.path.getmtime(model_path):
+            return None
+        return index
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def load_mapped_model(model_path, architecture='cnn', cache_directory=None):
+    """
+    Load the model with its parameters backed by a memory-mapped flat weight file.
+
+    The weight file is mapped copy-on-write, so every process using it shares the same physical
+    pages from the page cache, and the model in evaluation mode never writes to them. The file is
+    created with `export_mapped_weights` the first time, or again if the state dictionary changed.
+
+    The files are read under a shared lock and exported under an exclusive one. Once mapped, the
+    weights stay valid even if another process later replaces the file.
+
+    Parameters:
+    - model_path (str): Path to the model's state dictionary file.
+    - architecture (str): Key of the model's class in MODEL_ARCHITECTURES.
+    - cache_directory (str, optional): Directory of the files, see `mapped_weights_paths`.
+
+    Returns:
+    - torch.nn.Module: The loaded PyTorch model in evaluation mode.
+
+    Raises:
+    - FileNotFoundError: If the state dictionary file does not exist at the specified path.
+    - RuntimeError: If the exported files still do not match the state dictionary, for instance
+      because it was replaced while they were being written.
+    - ImportError: On platforms without fcntl file locks, such as Windows.
+    """
+    # Only imported here so the module, and the apps using it, still import where fcntl is missing
+    import fcntl
+
+    weights_path, index_path, lock_path = mapped_weights_paths(model_path, cache_directory)
+    with open(lock_path, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_SH)
+        index = read_mapped_index(model_path, weights_path, index_path)
+        if index is None:
+            # Another process may export in between releasing the shared lock and getting this one
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            index = read_mapped_index(model_path, weights_path, index_path)
+            if index is None:
+                export_mapped_weights(model_path, os.path.dirname(weights_path))
+                index = read_mapped_index(model_path, weights_path, index_path)
+                if index is None:
+                    raise RuntimeError(f"The mapped weights exported from {model_path} do not match it, "
+                                       "it may have changed while they were written")
+        weights = np.memmap(weights_path, dtype=np.uint8, mode='c')
+
+    state_dict = {}
+    for entry in index['tensors']:
+        dtype = np.dtype(entry['dtype'])
+        count = int(np.prod(entry['shape']))
+        array = weights[entry['offset']:entry['offset'] + count * dtype.itemsize].view(dtype)
+        state_dict[entry['name']] = torch.from_numpy(array.reshape(entry['shape']))
+
+    model = MODEL_ARCHITECTURES[architecture][0]()
+    model.load_state_dict(state_dict, assign=True)
+    model.eval()
+    return model
+
+
 def predict_cell_digits(model, cells):
     """
     Use a trained model to predict the digit in each Sudoku cell image.
@@ -54,7 +260,8 @@ def predict_cell_digits(model, cells):
 
     Parameters:
     - model (torch.nn.Module): The trained PyTorch model for digit prediction.
-    - cells (list of numpy.ndarray): A list of preprocessed cell images represented as 2D NumPy arrays.
+    - cells (list of numpy.ndarray or numpy.ndarray): A list of preprocessed cell images represented as 2D
+      NumPy arrays, or a float32 array of shape (N, 28, 28) such as the rows filled in `cell_buffer()`.
 
     Returns:
     - numpy.ndarray: An array of integers representing the predicted digits for each cell image.
@@ -67,8 +274,7 @@ def predict_cell_digits(model, cells):
     - The function adds two singleton dimensions to each cell image to match the expected input shape of the model.
     - Predictions are corrected by adding 1 to the output indices to shift from 0-indexing to 1-indexing (digits 1-9).
     """
-    cells = [torch.tensor(cell, dtype=torch.float).unsqueeze(0).unsqueeze(0) for cell in cells]
-    cells = torch.cat(cells, dim=0)
+    cells = cells_to_tensor(cells)
 
     if model is None or not isinstance(cells, torch.Tensor):
         raise ValueError("Invalid model or data type")
@@ -81,3 +287,55 @@ def predict_cell_digits(model, cells):
     return predictions.numpy() + 1  # Model predicts 0-8, need to correct for our digits
 
 
+def predict_cell_candidates(model, cells, k=3):
+    """
+    Use a trained model to get the k most probable digits for each Sudoku cell image.
+
+    The alternatives let a grid that cannot be solved be repaired by swapping a doubtful reading
+    for the model's next best guess, see `services.solver.repair`.
+
+    Parameters:
+    - model (torch.nn.Module): The trained PyTorch model for digit prediction.
+    - cells (list of numpy.ndarray or numpy.ndarray): Preprocessed cell images, as for `predict_cell_digits`.
+    - k (int): Number of alternatives to keep per cell, at most 9.
+
+    Returns:
+    - tuple of (numpy.ndarray, numpy.ndarray):
+        - digits: An (N, k) integer array of digits 1-9, most probable first. The first column
+          matches `predict_cell_digits`.
+        - probabilities: An (N, k) float array with the probability of each of those digits.
+
+    Raises:
+    - ValueError: If 'model' is None or 'cells' is not a list of NumPy arrays.
+    """
+    cells = cells_to_tensor(cells)
+
+    if model is None or not isinstance(cells, torch.Tensor):
+        raise ValueError("Invalid model or data type")
+
+    model.eval()
+    with torch.no_grad():
+        outputs = model(cells)  # Log probabilities
+        log_probabilities, classes = torch.topk(outputs, k, dim=1)
+
+    return classes.numpy() + 1, torch.exp(log_probabilities).numpy()
+
+
+def cells_to_tensor(cells):
+    """
+    Stack preprocessed cell images into a model input batch of shape (N, 1, 28, 28).
+
+    Parameters:
+    - cells (list of numpy.ndarray or numpy.ndarray): Preprocessed cell images.
+
+    Returns:
+    - torch.Tensor: The float32 input batch.
+    """
+    if isinstance(cells, np.ndarray) and cells.dtype == np.float32:
+        # A batch from the preprocessing buffer is used as the model input without copying
+        return torch.from_numpy(cells).unsqueeze(1)
+
+    cells = [torch.tensor(cell, dtype=torch.float).unsqueeze(0).unsqueeze(0) for cell in cells]
+    return torch.cat(cells, dim=0)
+
+
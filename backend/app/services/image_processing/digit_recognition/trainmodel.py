@@ -1,37 +1,72 @@
+# Run from backend/app: python -m services.image_processing.digit_recognition.trainmodel [--distill]
+import argparse
+import json
+import os
+import time
+import cv2
+import numpy as np
 import torch
-import torchvision
-import torchvision.transforms as transforms
-from torch.utils.data import DataLoader, random_split, ConcatDataset
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, random_split, ConcatDataset, TensorDataset
 from torch.optim.lr_scheduler import ReduceLROnPlateau
-from torchvision.datasets import ImageFolder, MNIST
 import torch.optim as optim
-from model import sudokuCNN
+from services.image_processing.digit_recognition.model import sudokuCNN, sudokuStudentCNN
+from services.image_processing.digit_recognition.tools import load_model
+from services.image_processing.loader import load_image
+from services.image_processing.image_preprocessor import isolate_sudoku
+from services.image_processing.cell_configurator import extract_all_cells
+from services.image_processing.cell_preprocessor import preprocess_and_select_cells
+from services.image_processing.synthetic import generate_puzzle, render_puzzle_image
 
-def main():
-    # Configuration
-    BATCH_SIZE = 4
-    NUM_EPOCHS = 30
-    TRAIN_SPLIT = 0.9
-    CUSTOM_DATA_PATH = './digit_recognition_data'  # Custom dataset path
+# Configuration
+BATCH_SIZE = 4
+NUM_EPOCHS = 30
+TRAIN_SPLIT = 0.9
+MODEL_DIRECTORY = os.path.dirname(os.path.abspath(__file__))  # Where load_model looks for the state dictionaries
+CUSTOM_DATA_PATH = os.path.join(MODEL_DIRECTORY, 'digit_recognition_data')  # Custom dataset path
+MNIST_DATA_PATH = os.path.join(MODEL_DIRECTORY, 'data')  # Where MNIST is downloaded to
+STUDENT_PATH = os.path.join(MODEL_DIRECTORY, 'sudoku_student_state_dict.pth')
+# Real photos the student's readings are compared with the teacher's on, they have no labels
+SAMPLE_PHOTO_DIRECTORY = os.path.join(MODEL_DIRECTORY, '..', '..', '..', '..', 'data', 'sudoku_tests')
+
+# Distillation settings, the student matches the teacher's outputs softened by TEMPERATURE
+DISTILL_BATCH_SIZE = 64
+DISTILL_EPOCHS = 10
+TEMPERATURE = 4.0
+SOFT_LOSS_WEIGHT = 0.9  # The rest of the loss is the usual loss on the true labels
+
+# Fonts the synthetic training photos are printed in, the script font stands in for handwriting
+SYNTHETIC_FONTS = (cv2.FONT_HERSHEY_SIMPLEX, cv2.FONT_HERSHEY_DUPLEX, cv2.FONT_HERSHEY_COMPLEX,
+                   cv2.FONT_HERSHEY_TRIPLEX, cv2.FONT_HERSHEY_SCRIPT_SIMPLEX,
+                   cv2.FONT_HERSHEY_SIMPLEX | cv2.FONT_ITALIC, cv2.FONT_HERSHEY_PLAIN)
+
+# Batch sizes timed in the model report, a single cell, a typical puzzle and a full grid
+REPORT_BATCH_SIZES = (1, 25, 81)
+
+
+def load_datasets():
+    # torchvision is only needed for the MNIST and custom datasets, distilling on synthetic cells works without it
+    import torchvision.transforms as transforms
+    from torchvision.datasets import ImageFolder, MNIST
 
     # Define transformations
     transform = transforms.Compose([
-        transforms.Resize((28, 28)),  
+        transforms.Resize((28, 28)),
         transforms.Grayscale(),       # Convert to grayscale if not already
         transforms.ToTensor(),
-        transforms.Normalize((0.5,), (0.5,))  
+        transforms.Normalize((0.5,), (0.5,))
     ])
 
     # Load and preprocess the MNIST dataset
-    mnist_trainset = MNIST(root='./data', train=True, download=True, transform=transform)
-    mnist_testset = MNIST(root='./data', train=False, download=True, transform=transform)
+    mnist_trainset = MNIST(root=MNIST_DATA_PATH, train=True, download=True, transform=transform)
+    mnist_testset = MNIST(root=MNIST_DATA_PATH, train=False, download=True, transform=transform)
 
     # Load your custom dataset
     custom_dataset = ImageFolder(root=CUSTOM_DATA_PATH, transform=transform)
 
     # Combine datasets
     combined_trainset = ConcatDataset([mnist_trainset, custom_dataset])
-    test_dataset = mnist_testset  
+    test_dataset = mnist_testset
 
     # Split combined dataset into training and validation sets
     train_size = int(TRAIN_SPLIT * len(combined_trainset))
@@ -41,6 +76,49 @@ def main():
     train_dataset = [(img, label-1) for img, label in train_dataset if label != 0]
     val_dataset = [(img, label-1) for img, label in val_dataset if label != 0]
     test_dataset = [(img, label-1) for img, label in test_dataset if label != 0]
+    return train_dataset, val_dataset, test_dataset
+
+
+def synthetic_cell_dataset(puzzles, seed):
+    """
+    Render synthetic puzzle photos and cut out their filled cells with the serving pipeline.
+
+    The cells go through the same isolation, extraction and preprocessing as uploaded photos, so
+    a model trained on them sees exactly what it is given in production. Each photo is printed in
+    a random font, size and stroke width. Cells the pipeline picks that are empty in the puzzle
+    are dropped.
+
+    Parameters:
+     - puzzles (int): Number of photos to render, each gives 25 to 35 cells.
+     - seed (int): Seed for the puzzles and render settings.
+
+    Returns:
+     - torch.utils.data.TensorDataset: (N, 1, 28, 28) cells and their labels 0-8 for digits 1-9.
+    """
+    rng = np.random.default_rng(seed)
+    images, labels = [], []
+    for _ in range(puzzles):
+        puzzle, _ = generate_puzzle(rng, givens=int(rng.integers(25, 36)))
+        font = SYNTHETIC_FONTS[rng.integers(len(SYNTHETIC_FONTS))]
+        # The plain font is drawn at half the size of the others
+        digit_size = rng.uniform(0.8, 1.4) * (2 if font == cv2.FONT_HERSHEY_PLAIN else 1)
+        image = render_puzzle_image(puzzle, rng, warp=rng.uniform(0, 0.08), blur=rng.uniform(0, 1.5),
+                                    gradient=rng.uniform(0, 0.5), font=font, digit_size=digit_size,
+                                    stroke=rng.uniform(0.4, 1.2))
+        try:
+            cells, positions = preprocess_and_select_cells(extract_all_cells(isolate_sudoku(image)))
+        except Exception:
+            continue  # The board was not found, as happens with real photos too
+        for cell, position in zip(cells, positions):
+            if puzzle.flat[position]:
+                images.append(np.asarray(cell, dtype=np.float32))
+                labels.append(puzzle.flat[position] - 1)
+
+    return TensorDataset(torch.from_numpy(np.stack(images)).unsqueeze(1), torch.tensor(labels))
+
+
+def main():
+    train_dataset, val_dataset, test_dataset = load_datasets()
 
     # Data loaders for training, validation, and test sets
     trainloader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True, num_workers=2, drop_last=True)
@@ -79,22 +157,227 @@ def main():
         print(f'Epoch {epoch + 1}/{NUM_EPOCHS}, Loss: {running_loss / len(trainloader)}, Val Loss: {val_loss}')
 
     # Testing phase
+    print(f'Accuracy on test images: {100 * accuracy(model, testloader)}%')
+
+    # Save only the state dictionary
+    torch.save(model.state_dict(), os.path.join(MODEL_DIRECTORY, 'sudoku_cnn_state_dict.pth'))
+
+
+def distill(data='synthetic', puzzles=600, epochs=DISTILL_EPOCHS, output=STUDENT_PATH,
+            report_path='model_report.json', seed=0):
+    """
+    Train sudokuStudentCNN to reproduce the trained sudokuCNN's outputs, then compare the two.
+
+    The student is trained on the teacher's probabilities softened by TEMPERATURE, which also tell
+    it which digits look alike, mixed with the ordinary loss on the true labels. Both models output
+    log probabilities, and dividing those by the temperature gives the same softmax as dividing
+    the logits would.
+
+    Parameters:
+     - data (str): 'synthetic' to train on cells cut from rendered photos, which needs no download,
+       or 'mnist' for the teacher's own MNIST and custom digit datasets.
+     - puzzles (int): Photos rendered for the synthetic training set, a fifth as many are held out.
+     - epochs (int): Training epochs.
+     - output (str): Where the student's state dictionary is saved.
+     - report_path (str): Where the JSON model report is written.
+     - seed (int): Seed for the synthetic data and the student's initial weights.
+
+    Returns:
+     - dict: The model report, see `report_models`.
+    """
+    torch.manual_seed(seed)
+    if data == 'synthetic':
+        train_dataset = synthetic_cell_dataset(puzzles, seed)
+        test_dataset = synthetic_cell_dataset(max(puzzles // 5, 1), seed + 1)
+    else:
+        train_dataset, _, test_dataset = load_datasets()
+    trainloader = DataLoader(train_dataset, batch_size=DISTILL_BATCH_SIZE, shuffle=True, drop_last=True)
+    testloader = DataLoader(test_dataset, batch_size=DISTILL_BATCH_SIZE)
+
+    teacher = load_model(architecture='cnn', mapped=False)
+    student = sudokuStudentCNN()
+    optimizer = optim.Adam(student.parameters(), lr=0.003)
+    scheduler = optim.lr_scheduler.CosineAnnealingLR(optimizer, epochs * len(trainloader))
+
+    for epoch in range(epochs):
+        student.train()
+        running_loss = 0.0
+        for inputs, labels in trainloader:
+            inputs = augment(inputs)
+            with torch.no_grad():
+                soft_targets = F.softmax(teacher(inputs) / TEMPERATURE, dim=1)
+            outputs = student(inputs)
+            soft_loss = F.kl_div(F.log_softmax(outputs / TEMPERATURE, dim=1), soft_targets,
+                                 reduction='batchmean') * TEMPERATURE ** 2
+            loss = SOFT_LOSS_WEIGHT * soft_loss + (1 - SOFT_LOSS_WEIGHT) * F.nll_loss(outputs, labels)
+
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            scheduler.step()
+            running_loss += loss.item()
+
+        print(f'Epoch {epoch + 1}/{epochs}, Loss: {running_loss / len(trainloader)}, '
+              f'Test accuracy: {100 * accuracy(student, testloader):.2f}%')
+
+    student.eval()
+    torch.save(student.state_dict(), output)
+
+    report = report_models({'cnn': teacher, 'student': student}, testloader, sample_photo_cells())
+    report['test_data'] = data
+    report['test_cells'] = len(test_dataset)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    for name, entry in report['models'].items():
+        latency = ', '.join(f"{size}: {entry['latency_ms'][str(size)]:.2f}ms" for size in REPORT_BATCH_SIZES)
+        agreement = f"{100 * entry['photo_agreement']:.2f}%" if entry['photo_agreement'] is not None else 'n/a'
+        print(f"{name:<8} accuracy {100 * entry['accuracy']:.2f}%  photo agreement with cnn {agreement}  "
+              f"parameters {entry['parameters']}  latency per batch ({latency})")
+    return report
+
+
+def augment(inputs, max_rotation=12, scale=(0.8, 1.15), max_shift=0.12, stroke_change=0.5):
+    """
+    Randomly rotate, scale, shift and thicken or thin a batch of cells.
+
+    The synthetic photos are printed in only a handful of fonts, so without this a student trained
+    on them learns those fonts rather than the digits, and disagrees with the teacher on real photos.
+
+    Parameters:
+     - inputs (torch.Tensor): (N, 1, 28, 28) batch of preprocessed cells.
+     - max_rotation (float): Largest rotation in degrees.
+     - scale (tuple of float): Range of the zoom factor.
+     - max_shift (float): Largest shift as a fraction of the cell size.
+     - stroke_change (float): Probability of dilating or eroding the strokes by one pixel.
+
+    Returns:
+     - torch.Tensor: The augmented batch.
+    """
+    count = inputs.shape[0]
+    angles = (torch.rand(count) * 2 - 1) * max_rotation * np.pi / 180
+    scales = torch.empty(count).uniform_(*scale)
+    cos, sin = torch.cos(angles) / scales, torch.sin(angles) / scales
+    shifts = (torch.rand(count, 2) * 2 - 1) * max_shift * 2
+    theta = torch.stack([torch.stack([cos, -sin, shifts[:, 0]], 1), torch.stack([sin, cos, shifts[:, 1]], 1)], 1)
+
+    # Cells are normalised with the background lowest, so padding with the minimum keeps it blank
+    background = inputs.amin(dim=(1, 2, 3), keepdim=True)
+    grid = F.affine_grid(theta, inputs.shape, align_corners=False)
+    outputs = F.grid_sample(inputs - background, grid, align_corners=False, padding_mode='zeros') + background
+
+    change = torch.rand(count)
+    dilate = change < stroke_change / 2
+    erode = (change >= stroke_change / 2) & (change < stroke_change)
+    outputs[dilate] = F.max_pool2d(outputs[dilate], 3, stride=1, padding=1)
+    outputs[erode] = -F.max_pool2d(-outputs[erode], 3, stride=1, padding=1)
+    return outputs
+
+
+def accuracy(model, loader):
+    """
+    Get the fraction of samples a model classifies correctly.
+    """
+    model.eval()
     correct = 0
     total = 0
     with torch.no_grad():
-        for images, labels in testloader:
+        for images, labels in loader:
             outputs = model(images)
             _, predicted = torch.max(outputs.data, 1)
             total += labels.size(0)
             correct += (predicted == labels).sum().item()
+    return correct / total
 
-    print(f'Accuracy on test images: {100 * correct / total}%')
-    
-    # Save only the state dictionary
-    torch.save(model.state_dict(), 'sudoku_cnn_state_dict.pth')
 
+def sample_photo_cells(photo_directory=SAMPLE_PHOTO_DIRECTORY):
+    """
+    Cut the filled cells out of the real sample photos with the serving pipeline.
 
+    Parameters:
+     - photo_directory (str): Directory of sudoku photos.
 
-# Required if using multiple workers 
+    Returns:
+     - torch.Tensor: (N, 1, 28, 28) batch of preprocessed cells, empty if no photo could be read.
+    """
+    cells = []
+    for file_name in sorted(os.listdir(photo_directory)) if os.path.isdir(photo_directory) else []:
+        try:
+            photo_cells, _ = preprocess_and_select_cells(
+                extract_all_cells(isolate_sudoku(load_image(os.path.join(photo_directory, file_name)))))
+        except Exception:
+            continue
+        cells.extend(np.asarray(cell, dtype=np.float32) for cell in photo_cells)
+    if not cells:
+        return torch.zeros(0, 1, 28, 28)
+    return torch.from_numpy(np.stack(cells)).unsqueeze(1)
+
+
+def report_models(models, testloader, photo_cells=None, repeat=50):
+    """
+    Compare models by test accuracy, parameter count and inference latency.
+
+    The first model is the reference for 'photo_agreement', the fraction of cells from real photos
+    that a model reads the same way it does, which stands in for accuracy on unlabelled photos.
+
+    Parameters:
+     - models (dict): Models in evaluation mode by name, the reference first.
+     - testloader (torch.utils.data.DataLoader): Labelled test cells.
+     - photo_cells (torch.Tensor, optional): Cells from real photos, from `sample_photo_cells`.
+     - repeat (int): Timed forward passes per batch size, the median is reported.
+
+    Returns:
+     - dict: For each model its 'accuracy', 'photo_agreement', 'parameters' and median
+       'latency_ms' per batch size, and the number of threads torch ran on.
+    """
+    report = {'torch_threads': torch.get_num_threads(), 'photo_cells': 0, 'models': {}}
+    reference_readings = None
+    if photo_cells is not None and len(photo_cells):
+        report['photo_cells'] = len(photo_cells)
+        with torch.no_grad():
+            reference_readings = next(iter(models.values()))(photo_cells).argmax(dim=1)
+
+    for name, model in models.items():
+        model.eval()
+        latency = {}
+        with torch.no_grad():
+            for batch_size in REPORT_BATCH_SIZES:
+                inputs = torch.zeros(batch_size, 1, 28, 28)
+                model(inputs)
+                times = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    model(inputs)
+                    times.append(time.perf_counter() - start)
+                latency[str(batch_size)] = float(np.median(times) * 1000)
+
+        agreement = None
+        if reference_readings is not None:
+            with torch.no_grad():
+                agreement = (model(photo_cells).argmax(dim=1) == reference_readings).float().mean().item()
+
+        report['models'][name] = {
+            'accuracy': accuracy(model, testloader),
+            'photo_agreement': agreement,
+            'parameters': sum(parameter.numel() for parameter in model.parameters()),
+            'latency_ms': latency,
+        }
+    return report
+
+
+# Required if using multiple workers
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description="Train the digit recognition model.")
+    parser.add_argument('--distill', action='store_true',
+                        help="Distill sudokuStudentCNN from the trained sudokuCNN instead of training sudokuCNN.")
+    parser.add_argument('--data', choices=('synthetic', 'mnist'), default='synthetic',
+                        help="Training cells for distillation.")
+    parser.add_argument('--puzzles', type=int, default=600, help="Synthetic photos rendered for distillation.")
+    parser.add_argument('--epochs', type=int, default=DISTILL_EPOCHS, help="Distillation epochs.")
+    parser.add_argument('--output', default=STUDENT_PATH, help="Where the student is saved.")
+    parser.add_argument('--report', default='model_report.json', help="Where the model comparison is written.")
+    args = parser.parse_args()
+
+    if args.distill:
+        distill(args.data, args.puzzles, args.epochs, args.output, args.report)
+    else:
+        main()
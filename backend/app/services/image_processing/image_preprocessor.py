@@ -32,10 +32,34 @@ def isolate_sudoku(image):
     - The image should be clear enough for the contours and corners to be detectable by edge 
       detection and contour approximation algorithms.
     """
-    # Find the corners of the sudoku, order them, figure out height and width of sudoku within image.
-    corners = get_sudoku_corners(image) 
+    # Find the corners of the sudoku, then warp them to a top-down view
+    corners = get_sudoku_corners(image)
+    if corners is None:
+        raise ValueError("Sudoku grid not detected.")
+    transformed_image = warp_sudoku(image, corners)
+
+    return transformed_image
+
+
+def warp_sudoku(image, corners, output_size=None):
+    """
+    Warp the region of an image bounded by four Sudoku corners to a top-down view.
+
+    Parameters:
+    - image (numpy.ndarray): The original image containing a Sudoku puzzle, in BGR color format.
+    - corners (numpy.ndarray): The four corner points of the Sudoku grid, in any order.
+    - output_size (tuple of int, optional): (width, height) of the warped image. If None, the size
+      is calculated from the corner positions so the grid keeps its resolution.
+
+    Returns:
+    - transformed_image (numpy.ndarray): The perspective-transformed image of the Sudoku puzzle.
+    """
+    # Order the corners, figure out height and width of sudoku within image.
     ordered_points = order_points(corners.reshape(4, 2))
-    maxWidth, maxHeight = calculate_dimensions(ordered_points)
+    if output_size is None:
+        maxWidth, maxHeight = calculate_dimensions(ordered_points)
+    else:
+        maxWidth, maxHeight = output_size
 
     # Construct destination points for perspective transform
     dst = np.array([
@@ -74,6 +98,8 @@ def get_sudoku_corners(image):
     
     # Find image contours. Largest contour should be the sudoku
     contours, _ = cv2.findContours(thresholded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
     largest_contour = max(contours, key=cv2.contourArea)
   
     # Get the perimeter of the largest contour
@@ -84,9 +110,7 @@ def get_sudoku_corners(image):
 
     if len(corners) == 4:
         return corners
-    else:
-        print("Sudoku grid not detected.")
-        return None
+    return None
 
 
 def order_points(corner_pts):
@@ -0,0 +1,175 @@
+# This module follows a sudoku through a stream of camera frames, only redoing work that changed
+import cv2
+import numpy as np
+from .image_preprocessor import get_sudoku_corners, warp_sudoku
+from .cell_configurator import extract_all_cells
+from .cell_preprocessor import preprocess_sudoku_cell, cell_buffer, find_candidate_cells
+from .digit_recognition.tools import predict_cell_digits
+
+
+class StreamSession:
+    """
+    Incrementally recognise a sudoku grid from a sequence of frames.
+
+    The four grid corners found in one frame are tracked into the next with pyramidal Lucas-Kanade
+    optical flow, so the full contour detection in `get_sudoku_corners` only runs on the first
+    frame, when tracking is lost, or every `redetect_interval` frames to correct drift. The tracked
+    board is warped to a fixed size, and each cell is compared to a small thumbnail kept from the
+    last time it was recognised. Only cells whose thumbnail changed noticeably go through
+    `preprocess_sudoku_cell` and the CNN again, the rest keep their previous prediction.
+
+    Parameters:
+    - model (torch.nn.Module): The loaded digit recognition model.
+    - board_size (int): Side length in pixels of the warped board used for every frame.
+    - change_threshold (float): Mean absolute grey level difference between a cell and its stored
+      thumbnail above which the cell is recognised again.
+    - redetect_interval (int): Maximum number of tracked frames before forcing a full detection.
+    """
+
+    SIGNATURE_SIZE = (16, 16)
+
+    def __init__(self, model, board_size=450, change_threshold=10.0, redetect_interval=30):
+        self.model = model
+        self.board_size = board_size
+        self.change_threshold = change_threshold
+        self.redetect_interval = redetect_interval
+
+        self.grid = np.zeros((9, 9), dtype=int)
+        self.previous_gray = None
+        self.corners = None
+        self.frames_since_detection = 0
+        self.cell_signatures = None
+
+    def process_frame(self, image):
+        """
+        Update the recognised grid with a new frame.
+
+        Parameters:
+        - image (numpy.ndarray): The frame in BGR color format.
+
+        Returns:
+        - dict: 'found' (bool) whether the grid was located in this frame, 'tracked' (bool) whether
+          the corners came from tracking rather than full detection, 'updatedCells' (list of int)
+          the cell positions (row * 9 + col) that were recognised again, and 'grid' the current
+          9x9 numpy grid.
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        corners = None
+        if self.corners is not None and self.frames_since_detection < self.redetect_interval:
+            corners = track_corners(self.previous_gray, gray, self.corners)
+        tracked = corners is not None
+
+        if tracked:
+            self.frames_since_detection += 1
+        else:
+            corners = get_sudoku_corners(image)
+            self.frames_since_detection = 0
+            if corners is None:
+                # Grid lost, forget the corners so the next frame runs a full detection
+                self.corners = None
+                self.previous_gray = None
+                return {'found': False, 'tracked': False, 'updatedCells': [], 'grid': self.grid}
+            corners = corners.astype(np.float32).reshape(4, 1, 2)
+
+        self.corners = corners
+        self.previous_gray = gray
+
+        transformed_image = warp_sudoku(image, corners, (self.board_size, self.board_size))
+        updated_cells = self.update_cells(extract_all_cells(transformed_image),
+                                          find_candidate_cells(transformed_image))
+
+        return {'found': True, 'tracked': tracked, 'updatedCells': updated_cells, 'grid': self.grid}
+
+    def update_cells(self, cells, candidate_cells=None):
+        """
+        Recognise the digits of the cells that changed since they were last recognised.
+
+        Parameters:
+        - cells (list of numpy.ndarray): The 81 BGR cell images of the warped board.
+        - candidate_cells (numpy.ndarray, optional): Boolean array from `find_candidate_cells`,
+          changed cells marked False are set empty without being preprocessed.
+
+        Returns:
+        - list of int: The positions of the cells that were recognised again.
+        """
+        signatures = np.stack([cell_signature(cell, self.SIGNATURE_SIZE) for cell in cells])
+
+        if self.cell_signatures is None:
+            changed = np.arange(81)
+        else:
+            differences = np.abs(signatures - self.cell_signatures).mean(axis=(1, 2))
+            changed = np.flatnonzero(differences > self.change_threshold)
+
+        buffer = cell_buffer()
+        filled_positions = []
+        for position in changed:
+            if candidate_cells is not None and not candidate_cells[position]:
+                self.grid.flat[position] = 0
+            elif preprocess_sudoku_cell(cells[position], out=buffer[len(filled_positions)]) is None:
+                self.grid.flat[position] = 0
+            else:
+                filled_positions.append(position)
+
+        if filled_positions:
+            predictions = predict_cell_digits(self.model, buffer[:len(filled_positions)])
+            self.grid.flat[filled_positions] = predictions
+
+        # Only refresh the thumbnails of recognised cells, so slow drift still adds up to a change
+        if self.cell_signatures is None:
+            self.cell_signatures = signatures
+        else:
+            self.cell_signatures[changed] = signatures[changed]
+
+        return changed.tolist()
+
+
+
+# Suplementary functions :
+
+def track_corners(previous_gray, gray, corners, max_area_change=0.3):
+    """
+    Track the grid corners from the previous frame into the current one.
+
+    Parameters:
+    - previous_gray (numpy.ndarray): Greyscale previous frame.
+    - gray (numpy.ndarray): Greyscale current frame.
+    - corners (numpy.ndarray): float32 array of shape (4, 1, 2) with the previous corners.
+    - max_area_change (float): Largest relative change in grid area accepted between frames.
+
+    Returns:
+    - numpy.ndarray or None: The tracked corners, or None if tracking was lost.
+    """
+    if previous_gray is None or previous_gray.shape != gray.shape:
+        return None
+
+    new_corners, status, _ = cv2.calcOpticalFlowPyrLK(
+        previous_gray, gray, corners, None, winSize=(21, 21), maxLevel=3
+    )
+    if new_corners is None or not status.all():
+        return None
+
+    # A tracked quadrilateral that folds over or jumps in size is a lost track
+    if not cv2.isContourConvex(new_corners.astype(np.int32)):
+        return None
+    previous_area = cv2.contourArea(corners)
+    new_area = cv2.contourArea(new_corners)
+    if previous_area == 0 or abs(new_area - previous_area) / previous_area > max_area_change:
+        return None
+
+    return new_corners
+
+
+def cell_signature(cell_image, size):
+    """
+    Compute a small greyscale thumbnail of a cell, used to detect changes between frames.
+
+    Parameters:
+    - cell_image (numpy.ndarray): An RGB image of a Sudoku cell.
+    - size (tuple of int): (width, height) of the thumbnail.
+
+    Returns:
+    - numpy.ndarray: float32 thumbnail of the cell.
+    """
+    gray = cv2.cvtColor(cell_image, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA).astype(np.float32)
@@ -0,0 +1,239 @@
+# This module renders synthetic sudoku photos with known ground truth, for load and accuracy testing
+import argparse
+import json
+import os
+import cv2
+import numpy as np
+from services.solver.generator import generate_full_grid
+from services.solver.grid_io import grid_to_string
+
+
+# Main functions :
+def generate_puzzle(rng, givens=30):
+    """
+    Generate a random valid sudoku puzzle together with its solution.
+
+    A random full grid from `generate_full_grid` is the solution, and cells are carved out of it
+    at random until only `givens` remain. Uniqueness of the solution is not checked, the puzzle is
+    only used as ground truth for what the image shows.
+
+    Parameters:
+     - rng (numpy.random.Generator): Source of randomness.
+     - givens (int): Number of filled cells to keep in the puzzle.
+
+    Returns:
+     - tuple of (numpy.ndarray, numpy.ndarray): The 9x9 puzzle, 0 for empty cells, and its solution.
+    """
+    solution = np.array(generate_full_grid(rng), dtype=int).reshape(9, 9)
+
+    puzzle = solution.copy()
+    carved = rng.choice(81, size=81 - givens, replace=False)
+    puzzle.flat[carved] = 0
+
+    return puzzle, solution
+
+
+def render_puzzle_image(puzzle, rng, resolution=(800, 800), warp=0.0, blur=0.0, gradient=0.0,
+                        font=cv2.FONT_HERSHEY_SIMPLEX, digit_size=1.0, stroke=1.0):
+    """
+    Render a sudoku puzzle as a photo-like BGR image.
+
+    The board is drawn flat with printed digits, placed on a page, then distorted by a random
+    perspective warp, a linear lighting gradient and a Gaussian blur.
+
+    Parameters:
+     - puzzle (numpy.ndarray): 9x9 grid to render, 0 for empty cells.
+     - rng (numpy.random.Generator): Source of randomness.
+     - resolution (tuple of int): (width, height) of the output image in pixels.
+     - warp (float): Maximum corner displacement as a fraction of the board size, 0 for a flat board.
+     - blur (float): Standard deviation of the Gaussian blur in pixels, 0 for no blur.
+     - gradient (float): Strength of the lighting gradient between 0 (even) and 1 (black at one edge).
+     - font (int): OpenCV Hershey font of the digits.
+     - digit_size (float): Digit height relative to the default.
+     - stroke (float): Digit stroke width relative to the default.
+
+    Returns:
+     - numpy.ndarray: The rendered image in BGR color format.
+    """
+    width, height = resolution
+    board_size = int(min(width, height) * 0.8)
+    board = draw_board(puzzle, board_size, font, digit_size, stroke)
+
+    # Place the board in the middle of a slightly off-white page
+    page = np.full((height, width, 3), 235, dtype=np.uint8)
+    top, left = (height - board_size) // 2, (width - board_size) // 2
+    page[top:top + board_size, left:left + board_size] = board
+
+    if warp > 0:
+        page = apply_perspective_warp(page, (left, top, board_size), warp, rng)
+    if gradient > 0:
+        page = apply_lighting_gradient(page, gradient, rng)
+    if blur > 0:
+        page = cv2.GaussianBlur(page, (0, 0), blur)
+
+    return page
+
+
+def generate_dataset(output_directory, count, seed=None, resolution=(800, 800), warp=0.0, blur=0.0,
+                     gradient=0.0, jpeg_quality=90, givens=(25, 35)):
+    """
+    Write a set of synthetic sudoku photos and their ground truth to a directory.
+
+    Images are written as JPEG files and the ground truth as one JSON record per image in
+    'ground_truth.jsonl', holding the image file name, puzzle, solution and render settings.
+
+    Parameters:
+     - output_directory (str): Directory the images are written to, created if missing.
+     - count (int): Number of images to generate.
+     - seed (int, optional): Seed for reproducible datasets.
+     - resolution (tuple of int): (width, height) of each image in pixels.
+     - warp (float): Maximum perspective warp, see `render_puzzle_image`.
+     - blur (float): Gaussian blur standard deviation, see `render_puzzle_image`.
+     - gradient (float): Lighting gradient strength, see `render_puzzle_image`.
+     - jpeg_quality (int): JPEG quality between 0 and 100.
+     - givens (tuple of int): Inclusive range the number of givens per puzzle is drawn from.
+
+    Returns:
+     - str: Path of the ground truth file.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    ground_truth_path = os.path.join(output_directory, 'ground_truth.jsonl')
+
+    with open(ground_truth_path, 'w') as ground_truth:
+        for i in range(count):
+            puzzle, solution = generate_puzzle(rng, givens=int(rng.integers(givens[0], givens[1] + 1)))
+            image = render_puzzle_image(puzzle, rng, resolution=resolution, warp=warp, blur=blur,
+                                        gradient=gradient)
+
+            file_name = f'synthetic_{i:06d}.jpg'
+            cv2.imwrite(os.path.join(output_directory, file_name), image,
+                        [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+
+            record = {
+                'file': file_name,
+                'puzzle': grid_to_string(puzzle),
+                'solution': grid_to_string(solution),
+                'resolution': list(resolution),
+                'warp': warp,
+                'blur': blur,
+                'gradient': gradient,
+                'jpeg_quality': jpeg_quality,
+            }
+            ground_truth.write(json.dumps(record) + '\n')
+
+    return ground_truth_path
+
+
+
+# Suplementary functions :
+
+def draw_board(puzzle, board_size, font=cv2.FONT_HERSHEY_SIMPLEX, digit_size=1.0, stroke=1.0):
+    """
+    Draw a flat, top-down sudoku board with printed digits.
+
+    Parameters:
+     - puzzle (numpy.ndarray): 9x9 grid to draw, 0 for empty cells.
+     - board_size (int): Side length of the board in pixels.
+     - font (int): OpenCV Hershey font of the digits.
+     - digit_size (float): Digit height relative to the default.
+     - stroke (float): Digit stroke width relative to the default.
+
+    Returns:
+     - numpy.ndarray: The board as a BGR image of shape (board_size, board_size, 3).
+    """
+    board = np.full((board_size, board_size, 3), 255, dtype=np.uint8)
+    cell_size = board_size / 9
+
+    # Grid lines, thicker around each 3x3 box and the outer border
+    for i in range(10):
+        thickness = max(int(cell_size * (0.08 if i % 3 == 0 else 0.03)), 1)
+        position = min(int(round(i * cell_size)), board_size - 1)
+        cv2.line(board, (position, 0), (position, board_size - 1), (0, 0, 0), thickness)
+        cv2.line(board, (0, position), (board_size - 1, position), (0, 0, 0), thickness)
+
+    # Digits, centred in their cells
+    font_scale = cell_size / 40 * digit_size
+    thickness = max(int(cell_size / 20 * stroke), 1)
+    for row in range(9):
+        for col in range(9):
+            if puzzle[row, col] == 0:
+                continue
+            text = str(puzzle[row, col])
+            (text_width, text_height), _ = cv2.getTextSize(text, font, font_scale, thickness)
+            x = int((col + 0.5) * cell_size - text_width / 2)
+            y = int((row + 0.5) * cell_size + text_height / 2)
+            cv2.putText(board, text, (x, y), font, font_scale, (0, 0, 0), thickness, cv2.LINE_AA)
+
+    return board
+
+
+def apply_perspective_warp(image, board_box, warp, rng):
+    """
+    Move each board corner by a random offset and warp the image to match.
+
+    Parameters:
+     - image (numpy.ndarray): The page image containing the flat board.
+     - board_box (tuple of int): (left, top, size) of the board within the image.
+     - warp (float): Maximum corner displacement as a fraction of the board size.
+     - rng (numpy.random.Generator): Source of randomness.
+
+    Returns:
+     - numpy.ndarray: The warped image, with uncovered areas filled with the page colour.
+    """
+    left, top, size = board_box
+    corners = np.array([
+        [left, top],
+        [left + size, top],
+        [left + size, top + size],
+        [left, top + size]
+    ], dtype="float32")
+    offsets = rng.uniform(-warp, warp, size=(4, 2)) * size
+    transform_matrix = cv2.getPerspectiveTransform(corners, (corners + offsets).astype("float32"))
+
+    return cv2.warpPerspective(image, transform_matrix, (image.shape[1], image.shape[0]),
+                               borderMode=cv2.BORDER_CONSTANT, borderValue=(235, 235, 235))
+
+
+def apply_lighting_gradient(image, gradient, rng):
+    """
+    Darken the image along a random direction to imitate uneven lighting.
+
+    Parameters:
+     - image (numpy.ndarray): BGR image.
+     - gradient (float): Darkening at the far edge, between 0 (none) and 1 (black).
+     - rng (numpy.random.Generator): Source of randomness.
+
+    Returns:
+     - numpy.ndarray: The shaded image.
+    """
+    height, width = image.shape[:2]
+    angle = rng.uniform(0, 2 * np.pi)
+    ys, xs = np.mgrid[0:height, 0:width].astype(np.float32)
+    projection = xs * np.cos(angle) + ys * np.sin(angle)
+    projection = (projection - projection.min()) / (projection.max() - projection.min())
+
+    shading = 1 - gradient * projection
+    shaded = image.astype(np.float32) * shading[..., np.newaxis]
+
+    return np.clip(shaded, 0, 255).astype(np.uint8)
+
+
+# Main script execution, run from backend/app with `python -m services.image_processing.synthetic`
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic sudoku photos with ground truth.")
+    parser.add_argument('output_directory', help="Directory to write images and ground_truth.jsonl to.")
+    parser.add_argument('--count', type=int, default=100, help="Number of images to generate.")
+    parser.add_argument('--seed', type=int, default=None, help="Seed for a reproducible dataset.")
+    parser.add_argument('--width', type=int, default=800, help="Image width in pixels.")
+    parser.add_argument('--height', type=int, default=800, help="Image height in pixels.")
+    parser.add_argument('--warp', type=float, default=0.05, help="Maximum perspective warp (fraction of board).")
+    parser.add_argument('--blur', type=float, default=1.0, help="Gaussian blur sigma in pixels.")
+    parser.add_argument('--gradient', type=float, default=0.3, help="Lighting gradient strength (0-1).")
+    parser.add_argument('--jpeg-quality', type=int, default=90, help="JPEG quality (0-100).")
+    args = parser.parse_args()
+
+    path = generate_dataset(args.output_directory, args.count, seed=args.seed,
+                            resolution=(args.width, args.height), warp=args.warp, blur=args.blur,
+                            gradient=args.gradient, jpeg_quality=args.jpeg_quality)
+    print(f"Wrote {args.count} images, ground truth in {path}")
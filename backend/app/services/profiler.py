@@ -0,0 +1,187 @@
+# This module samples the call stacks of selected requests and writes them out for flamegraphs
+import functools
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from flask import request, make_response
+
+
+def read_float_env(name, default, minimum=0.0, maximum=None):
+    """
+    Read a number from an environment variable, falling back to the default if it is not valid.
+
+    Parameters:
+    - name (str): Name of the environment variable.
+    - default (float): Value used if the variable is unset or not a number.
+    - minimum (float): Smallest accepted value, smaller values are raised to it.
+    - maximum (float, optional): Largest accepted value, larger values are lowered to it.
+
+    Returns:
+    - float: The value.
+    """
+    raw = os.environ.get(name)
+    if raw is None:
+        return default
+    try:
+        value = float(raw)
+    except ValueError:
+        logging.warning(f"Ignoring {name}={raw!r}, it is not a number, using {default}")
+        return default
+    if value != value:  # NaN
+        return default
+    value = max(value, minimum)
+    return value if maximum is None else min(value, maximum)
+
+
+# Profiling is only possible when a directory for the profiles is configured
+PROFILE_DIRECTORY = os.environ.get('SUDOKU_PROFILE_DIR')
+# Fraction of requests profiled without being asked to, from 0 to 1
+PROFILE_RATE = read_float_env('SUDOKU_PROFILE_RATE', 0.0, maximum=1.0)
+# Milliseconds between stack samples
+PROFILE_INTERVAL_MS = read_float_env('SUDOKU_PROFILE_INTERVAL_MS', 1.0, minimum=0.1)
+# Shared secret a client sends as its X-Profile header to have the request profiled, unset to
+# ignore the header so only the random sampling applies
+PROFILE_TOKEN = os.environ.get('SUDOKU_PROFILE_TOKEN')
+PROFILE_HEADER = 'X-Profile'
+# Most profile files kept in the directory, profiling stops once it holds this many
+PROFILE_MAX_FILES = int(read_float_env('SUDOKU_PROFILE_MAX_FILES', 100))
+PROFILE_SUFFIX = '.collapsed'
+
+
+class StackSampler:
+    """
+    Sample the call stack of one thread from a background thread.
+
+    Stacks are counted in the collapsed format used by flamegraph.pl and speedscope, one
+    "outer;...;inner count" line per distinct stack. Calls into numpy, OpenCV and torch show up as
+    the Python line that made them, so time spent in a native call is attributed to that line.
+
+    Parameters:
+    - thread_id (int): Ident of the thread to sample.
+    - interval (float): Seconds between samples.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        """
+        Start sampling.
+        """
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop sampling and wait for the sampling thread to finish.
+        """
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            key = ';'.join(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def write(self, file_name):
+        """
+        Write the sampled stacks in collapsed stack format.
+
+        Parameters:
+        - file_name (str): Path of the file to write.
+        """
+        with open(file_name, 'w') as f:
+            for stack, count in sorted(self.counts.items()):
+                f.write(f"{stack} {count}\n")
+
+
+def profile_request(view):
+    """
+    Decorate a Flask view so that selected requests have their call stacks sampled.
+
+    A request is profiled at random for a SUDOKU_PROFILE_RATE fraction of requests, or if its
+    X-Profile header matches SUDOKU_PROFILE_TOKEN. Without a token the header is ignored, so
+    clients cannot force profiling. Its samples are written to SUDOKU_PROFILE_DIR as
+    <view name>-<request id>.collapsed, using the X-Request-ID header as the id if the client sent
+    one. The id is returned in the X-Request-ID response header of profiled requests. Once the
+    directory holds SUDOKU_PROFILE_MAX_FILES profiles no more requests are profiled, until some
+    are removed.
+
+    Without SUDOKU_PROFILE_DIR the view is returned undecorated, so profiling costs nothing.
+
+    Parameters:
+    - view (callable): The Flask view function.
+
+    Returns:
+    - callable: The view, wrapped if profiling is enabled.
+    """
+    if not PROFILE_DIRECTORY:
+        return view
+
+    os.makedirs(PROFILE_DIRECTORY, exist_ok=True)
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not should_profile() or profile_count() >= PROFILE_MAX_FILES:
+            return view(*args, **kwargs)
+
+        # Only keep characters that are safe in a file name from a client supplied id
+        request_id = re.sub(r'[^A-Za-z0-9_.-]', '', request.headers.get('X-Request-ID', ''))[:64]
+        request_id = request_id or uuid.uuid4().hex
+
+        sampler = StackSampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            response = view(*args, **kwargs)
+        finally:
+            sampler.stop()
+            sampler.write(os.path.join(PROFILE_DIRECTORY, f"{view.__name__}-{request_id}{PROFILE_SUFFIX}"))
+
+        response = make_response(response)
+        response.headers['X-Request-ID'] = request_id
+        response.headers['X-Profile-Duration-Ms'] = f"{(time.perf_counter() - start) * 1000:.1f}"
+        return response
+
+    return wrapper
+
+
+def should_profile():
+    """
+    Decide whether the current request is profiled, from its X-Profile header or at random.
+
+    Returns:
+    - bool: True if the request should be profiled.
+    """
+    requested = request.headers.get(PROFILE_HEADER)
+    if PROFILE_TOKEN and requested and hmac.compare_digest(requested.encode(), PROFILE_TOKEN.encode()):
+        return True
+    return PROFILE_RATE > 0 and random.random() < PROFILE_RATE
+
+
+def profile_count():
+    """
+    Count the profiles in the profile directory, shared by every worker writing to it.
+
+    Returns:
+    - int: The number of profile files.
+    """
+    with os.scandir(PROFILE_DIRECTORY) as entries:
+        return sum(1 for entry in entries if entry.name.endswith(PROFILE_SUFFIX))
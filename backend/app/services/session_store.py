@@ -0,0 +1,88 @@
+# This module keeps per-client session objects in memory between requests
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class SessionStore:
+    """
+    Thread safe in-memory store of session objects keyed by a random id.
+
+    Each session gets its own lock, so requests for one session run one at a time while different
+    sessions are served in parallel. Sessions not used for `ttl` seconds are dropped, and once
+    `max_sessions` are stored the least recently used one is dropped to make room for a new one.
+
+    Sessions are kept in least recently used order, so expiry only looks at the oldest entries and
+    every operation takes constant time however many sessions are live.
+
+    Parameters:
+    - ttl (float): Seconds of inactivity after which a session expires.
+    - max_sessions (int): Most sessions kept at once.
+    """
+
+    def __init__(self, ttl=300, max_sessions=10000):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, session):
+        """
+        Store a new session.
+
+        Parameters:
+        - session (object): The session object.
+
+        Returns:
+        - str: The id of the new session.
+        """
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._expire()
+            while len(self._sessions) >= self.max_sessions:
+                self._sessions.popitem(last=False)
+            self._sessions[session_id] = [session, threading.Lock(), time.monotonic()]
+        return session_id
+
+    def get(self, session_id):
+        """
+        Look up a session and mark it as used.
+
+        Parameters:
+        - session_id (str): The id returned by `create`.
+
+        Returns:
+        - tuple or None: (session, lock) where lock must be held while using the session, or None if
+          the id is unknown or expired.
+        """
+        with self._lock:
+            self._expire()
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            entry[2] = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return entry[0], entry[1]
+
+    def delete(self, session_id):
+        """
+        Remove a session.
+
+        Parameters:
+        - session_id (str): The id returned by `create`.
+
+        Returns:
+        - bool: True if the session existed.
+        """
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def _expire(self):
+        # Must be called with self._lock held, the oldest sessions are at the front
+        now = time.monotonic()
+        while self._sessions:
+            _, (_, _, last_used) = next(iter(self._sessions.items()))
+            if now - last_used <= self.ttl:
+                break
+            self._sessions.popitem(last=False)
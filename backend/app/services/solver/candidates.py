@@ -0,0 +1,185 @@
+# This module holds the bitmask candidate representation shared by the logical solving tools
+import numpy as np
+
+# Candidates for a cell are stored as a 9 bit integer, bit (value - 1) is set if value is possible
+ALL_CANDIDATES = 0x1FF
+
+# The 27 units (rows, columns, boxes) as lists of cell positions, position = row * 9 + col
+ROWS = [[row * 9 + col for col in range(9)] for row in range(9)]
+COLUMNS = [[row * 9 + col for row in range(9)] for col in range(9)]
+BOXES = [[(3 * (box // 3) + i // 3) * 9 + 3 * (box % 3) + i % 3 for i in range(9)] for box in range(9)]
+UNITS = ROWS + COLUMNS + BOXES
+
+# For each cell, the indices into UNITS of its row, column and box, and the 20 cells sharing a unit with it
+CELL_UNITS = [(pos // 9, 9 + pos % 9, 18 + 3 * (pos // 27) + (pos % 9) // 3) for pos in range(81)]
+PEERS = [sorted({peer for unit in CELL_UNITS[pos] for peer in UNITS[unit]} - {pos}) for pos in range(81)]
+
+# Lookup tables over every possible candidate mask, used in the search's inner loop
+MASK_COUNTS = [bin(mask).count('1') for mask in range(ALL_CANDIDATES + 1)]
+MASK_VALUES = [[value for value in range(1, 10) if mask & (1 << (value - 1))] for mask in range(ALL_CANDIDATES + 1)]
+
+
+class SearchLimitReached(Exception):
+    """
+    Raised when a search attempt uses up its node budget.
+    """
+
+
+def value_bit(value):
+    """
+    Get the candidate bit for a value.
+
+    Parameters:
+     - value (int): A sudoku value from 1 to 9.
+
+    Returns:
+     - int: The bitmask with only that value set.
+    """
+    return 1 << (value - 1)
+
+
+def bit_values(mask):
+    """
+    List the values whose bits are set in a candidate mask.
+
+    Parameters:
+     - mask (int): A candidate bitmask.
+
+    Returns:
+     - list of int: The values, in increasing order.
+    """
+    return MASK_VALUES[mask]
+
+
+def grid_values(grid):
+    """
+    Flatten a 9x9 sudoku grid into a list of 81 Python ints.
+
+    Parameters:
+     - grid (numpy.ndarray or list): 9x9 grid, 0 for empty cells.
+
+    Returns:
+     - list of int: The cell values, row by row.
+
+    Raises:
+     - ValueError: If the grid is not 9x9 or holds values outside 0-9.
+    """
+    grid = np.asarray(grid)
+    if grid.shape != (9, 9):
+        raise ValueError("Sudoku grid must be 9x9")
+    values = [int(value) for value in grid.flat]
+    if any(value < 0 or value > 9 for value in values):
+        raise ValueError("Sudoku grid values must be between 0 and 9")
+    return values
+
+
+def find_conflicts(values):
+    """
+    Find the filled cells that share a value with another cell in the same unit.
+
+    Parameters:
+     - values (list of int): The 81 cell values, 0 for empty cells.
+
+    Returns:
+     - list of int: Sorted positions of the conflicting cells, empty if the grid is consistent.
+    """
+    conflicts = set()
+    for unit in UNITS:
+        seen = {}
+        for pos in unit:
+            value = values[pos]
+            if value == 0:
+                continue
+            if value in seen:
+                conflicts.update((pos, seen[value]))
+            else:
+                seen[value] = pos
+    return sorted(conflicts)
+
+
+def compute_candidates(values):
+    """
+    Compute the candidate bitmask of every cell from the values placed in its units.
+
+    Parameters:
+     - values (list of int): The 81 cell values, 0 for empty cells.
+
+    Returns:
+     - list of int: 81 candidate masks, 0 for filled cells.
+    """
+    used = [0] * 27
+    for pos, value in enumerate(values):
+        if value:
+            for unit in CELL_UNITS[pos]:
+                used[unit] |= value_bit(value)
+
+    candidates = [0] * 81
+    for pos, value in enumerate(values):
+        if value == 0:
+            row, col, box = CELL_UNITS[pos]
+            candidates[pos] = ALL_CANDIDATES & ~(used[row] | used[col] | used[box])
+    return candidates
+
+
+def search_solutions(values, candidates, limit=1, stats=None, max_nodes=None):
+    """
+    Find solutions by depth first search over candidate bitmasks.
+
+    The empty cell with the fewest candidates is branched on first, and each placement removes the
+    value from the candidates of its peers, backtracking as soon as a peer is left with none.
+
+    Parameters:
+     - values (list of int): The 81 cell values, 0 for empty cells. Not modified.
+     - candidates (list of int): The 81 candidate masks matching `values`. Not modified.
+     - limit (int): Stop after this many solutions have been found.
+     - stats (dict, optional): If given, its 'nodes' entry is increased by the number of search
+       nodes visited, a measure of how much guessing the grid needs.
+     - max_nodes (int, optional): Give up after visiting this many search nodes.
+
+    Returns:
+     - list of list of int: Up to `limit` solutions, each as 81 values.
+
+    Raises:
+     - SearchLimitReached: If `max_nodes` nodes were visited before the search finished.
+    """
+    solutions = []
+    budget = [max_nodes]
+
+    def search(values, candidates):
+        if stats is not None:
+            stats['nodes'] = stats.get('nodes', 0) + 1
+        if max_nodes is not None:
+            budget[0] -= 1
+            if budget[0] < 0:
+                raise SearchLimitReached()
+        best_pos, best_count = -1, 10
+        for pos in range(81):
+            if values[pos] == 0:
+                count = MASK_COUNTS[candidates[pos]]
+                if count < best_count:
+                    best_pos, best_count = pos, count
+                    if count <= 1:
+                        break
+        if best_pos == -1:
+            solutions.append(values)
+            return len(solutions) >= limit
+
+        for value in MASK_VALUES[candidates[best_pos]]:
+            bit = 1 << (value - 1)
+            next_values = values[:]
+            next_values[best_pos] = value
+            next_candidates = candidates[:]
+            next_candidates[best_pos] = 0
+            dead_end = False
+            for peer in PEERS[best_pos]:
+                if next_candidates[peer] & bit:
+                    next_candidates[peer] &= ~bit
+                    if next_candidates[peer] == 0 and next_values[peer] == 0:
+                        dead_end = True
+                        break
+            if not dead_end and search(next_values, next_candidates):
+                return True
+        return False
+
+    search(list(values), list(candidates))
+    return solutions
@@ -0,0 +1,175 @@
+# This module generates unique-solution sudoku puzzles and rates how hard they are
+import argparse
+import functools
+import json
+import multiprocessing
+import time
+import numpy as np
+from .candidates import value_bit, compute_candidates, search_solutions
+from .hints import find_hint, TECHNIQUES
+from .grid_io import grid_to_string
+
+# Difficulty label for the hardest technique a puzzle needs, 'search' meaning logic alone gets stuck
+DIFFICULTY = {
+    'naked_single': 'easy',
+    'hidden_single': 'medium',
+    'pointing_pair': 'hard',
+    'box_line_reduction': 'hard',
+    'naked_pair': 'hard',
+    'search': 'expert',
+}
+
+
+#  Main functions
+def generate_full_grid(rng):
+    """
+    Generate a random completely filled sudoku grid.
+
+    The three diagonal 3x3 boxes do not constrain each other, so they are filled with random
+    permutations of 1-9 before the candidate search completes the grid.
+
+    Parameters:
+     - rng (numpy.random.Generator): Source of randomness.
+
+    Returns:
+     - list of int: The 81 values of the grid, row by row.
+    """
+    values = [0] * 81
+    for box in range(3):
+        for i, value in enumerate(rng.permutation(9) + 1):
+            values[(3 * box + i // 3) * 9 + 3 * box + i % 3] = int(value)
+
+    return search_solutions(values, compute_candidates(values), limit=1)[0]
+
+
+def carve_puzzle(solution, rng, min_givens=17):
+    """
+    Remove values from a filled grid for as long as the puzzle keeps a unique solution.
+
+    Cells are tried in random order, and a removal is undone if the puzzle would then have more
+    than one solution. A removed value that is the only candidate left for its cell cannot make the
+    solution ambiguous, so the search is skipped for those.
+
+    Parameters:
+     - solution (list of int): The 81 values of a filled grid.
+     - rng (numpy.random.Generator): Source of randomness.
+     - min_givens (int): Stop carving once only this many values are left.
+
+    Returns:
+     - list of int: The 81 values of the puzzle, 0 for empty cells.
+    """
+    puzzle = list(solution)
+    givens = 81
+    for pos in rng.permutation(81):
+        if givens <= min_givens:
+            break
+        value = puzzle[pos]
+        puzzle[pos] = 0
+        candidates = compute_candidates(puzzle)
+        if candidates[pos] == value_bit(value) or len(search_solutions(puzzle, candidates, limit=2)) == 1:
+            givens -= 1
+        else:
+            puzzle[pos] = value
+
+    return puzzle
+
+
+def rate_puzzle(puzzle):
+    """
+    Rate the difficulty of a puzzle.
+
+    The puzzle is played out with `find_hint`, recording the hardest technique needed. If logic
+    alone gets stuck the technique is 'search'. The number of nodes a candidate search visits to
+    solve the puzzle is also counted.
+
+    Parameters:
+     - puzzle (list of int): The 81 values of the puzzle, 0 for empty cells.
+
+    Returns:
+     - dict: 'technique' (hardest technique needed), 'difficulty' (label from DIFFICULTY) and
+       'nodes' (search nodes visited).
+    """
+    grid = np.array(puzzle, dtype=int).reshape(9, 9)
+    hardest = TECHNIQUES[0]
+    while True:
+        hint = find_hint(grid)
+        if hint is None:
+            break
+        hardest = max(hardest, hint['technique'], key=TECHNIQUES.index)
+        grid[hint['row'], hint['col']] = hint['value']
+
+    if (grid == 0).any():
+        hardest = 'search'
+
+    stats = {'nodes': 0}
+    search_solutions(puzzle, compute_candidates(puzzle), limit=1, stats=stats)
+
+    return {'technique': hardest, 'difficulty': DIFFICULTY[hardest], 'nodes': stats['nodes']}
+
+
+def generate_puzzle(seed, min_givens=17):
+    """
+    Generate and rate one puzzle.
+
+    Parameters:
+     - seed (int or sequence of int): Seed for the random number generator, so runs are reproducible.
+     - min_givens (int): Minimum number of values kept in the puzzle.
+
+    Returns:
+     - dict: The puzzle and solution as 81 character strings, number of givens, and its rating.
+    """
+    rng = np.random.default_rng(seed)
+    solution = generate_full_grid(rng)
+    puzzle = carve_puzzle(solution, rng, min_givens=min_givens)
+
+    record = {
+        'puzzle': grid_to_string(puzzle),
+        'solution': grid_to_string(solution),
+        'givens': sum(1 for value in puzzle if value),
+    }
+    record.update(rate_puzzle(puzzle))
+    return record
+
+
+def generate_puzzles(output_file, count, workers=None, seed=0, min_givens=17):
+    """
+    Generate puzzles across a process pool, writing each one to a JSONL file as it completes.
+
+    Parameters:
+     - output_file (str): Path of the JSONL file, one puzzle record per line.
+     - count (int): Number of puzzles to generate.
+     - workers (int, optional): Number of worker processes, defaults to the number of CPUs.
+     - seed (int): Base seed, puzzle i is generated from the seed (seed, i).
+     - min_givens (int): Minimum number of values kept in each puzzle.
+
+    Returns:
+     - int: The number of puzzles written.
+    """
+    seeds = ((seed, i) for i in range(count))
+    written = 0
+    with multiprocessing.Pool(workers) as pool, open(output_file, 'w') as f:
+        for record in pool.imap_unordered(functools.partial(generate_puzzle, min_givens=min_givens), seeds,
+                                         chunksize=16):
+            f.write(json.dumps(record) + '\n')
+            written += 1
+
+    return written
+
+
+
+# Main script execution, run from backend/app with `python -m services.solver.generator`
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate rated sudoku puzzles with unique solutions.")
+    parser.add_argument('output_file', help="JSONL file to write puzzles to.")
+    parser.add_argument('--count', type=int, default=1000, help="Number of puzzles to generate.")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes, defaults to CPU count.")
+    parser.add_argument('--seed', type=int, default=0, help="Base seed for reproducible runs.")
+    parser.add_argument('--min-givens', type=int, default=17, help="Minimum number of givens per puzzle.")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    written = generate_puzzles(args.output_file, args.count, workers=args.workers, seed=args.seed,
+                               min_givens=args.min_givens)
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {written} puzzles to {args.output_file} in {elapsed:.1f}s "
+          f"({written / elapsed * 60:.0f} puzzles/minute)")
@@ -0,0 +1,338 @@
+import functools
+import math
+import random
+import numpy as np
+from .candidates import SearchLimitReached
+
+
+# Search nodes per unit of the restart schedule
+RESTART_NODES = 200
+
+
+#  Main function
+def generic_solver(sudoku):
+    """
+    Solves a sudoku of any box size from 2 to 5 (4x4 up to 25x25) using bitset candidates.
+
+    Candidates are kept as one integer bitset per cell. Naked singles, hidden singles and locked
+    candidates are propagated after every placement, and when propagation stalls the search
+    branches on the empty cell with the fewest candidates. The search is restarted on a schedule of
+    node budgets to avoid getting stuck in one unlucky branch.
+
+    Parameters:
+     - sudoku (numpy array): An NxN numpy array representing the grid, where N is the square of
+                            the box size and 0 indicates an empty cell. Filled in place.
+
+    Returns:
+     - boolean: True if the puzzle is solved, False if it cannot be solved.
+
+    Raises:
+     - ValueError: If the grid is not square with a side of 4, 9, 16 or 25, or holds values out of range.
+    """
+    # The shape is only read once the grid is known to be two dimensional, it comes straight from requests
+    if sudoku.ndim != 2 or not np.issubdtype(sudoku.dtype, np.integer):
+        raise ValueError("Sudoku grid must be NxN integers with N one of 4, 9, 16 or 25")
+    size = sudoku.shape[0]
+    box_size = math.isqrt(size)
+    if sudoku.shape[1] != size or box_size * box_size != size or not 2 <= box_size <= 5:
+        raise ValueError("Sudoku grid must be NxN with N one of 4, 9, 16 or 25")
+    if sudoku.min() < 0 or sudoku.max() > size:
+        raise ValueError(f"Sudoku grid values must be between 0 and {size}")
+
+    layout = build_layout(box_size)
+
+    values = [0] * (size * size)
+    candidates = [layout['all_candidates']] * (size * size)
+    singles = []
+    for pos, value in enumerate(int(value) for value in sudoku.flat):
+        if value:
+            if not candidates[pos] & (1 << (value - 1)):
+                return False  # Value clashes with a given peer
+            place(values, candidates, layout, pos, value, singles)
+
+    # Searches on large grids have heavy tailed run times, so each attempt gets a node budget and the
+    # search restarts with a different random tie-break when it runs out. Budgets follow the Luby
+    # sequence (1, 1, 2, 1, 1, 2, 4, ...) so the search stays complete while most attempts stay short.
+    rng = random.Random(0)
+    attempt = 1
+    while True:
+        budget = {'nodes': RESTART_NODES * luby(attempt), 'rng': rng}
+        try:
+            solution = search(values[:], candidates[:], layout, singles[:], budget)
+            break
+        except SearchLimitReached:
+            attempt += 1
+
+    if solution is None:
+        return False
+
+    sudoku[:] = np.array(solution, dtype=sudoku.dtype).reshape(size, size)
+    return True
+
+
+# Supplementary functions
+@functools.lru_cache(maxsize=None)
+def build_layout(box_size):
+    """
+    Build the units, peers and box/line intersections of a grid with the given box size.
+
+    Parameters:
+     - box_size (int): Side length of a box, the grid is box_size² cells wide.
+
+    Returns:
+     - dict: 'units' the rows, columns and boxes as lists of cell positions, 'peers' the cells sharing
+       a unit with each cell, 'intersections' a (segment, rest of box, rest of line) tuple for every
+       place a box crosses a row or column, and 'all_candidates' the bitset with every value set.
+    """
+    size = box_size * box_size
+    rows = [[row * size + col for col in range(size)] for row in range(size)]
+    columns = [[row * size + col for row in range(size)] for col in range(size)]
+    boxes = [[(box_size * (box // box_size) + i // box_size) * size + box_size * (box % box_size) + i % box_size
+              for i in range(size)] for box in range(size)]
+    units = rows + columns + boxes
+
+    peers = [set() for _ in range(size * size)]
+    for unit in units:
+        for pos in unit:
+            peers[pos].update(unit)
+    peers = [sorted(cell_peers - {pos}) for pos, cell_peers in enumerate(peers)]
+
+    intersections = []
+    for box in boxes:
+        for line in rows + columns:
+            segment = [pos for pos in box if pos in line]
+            if segment:
+                intersections.append((segment,
+                                      [pos for pos in box if pos not in segment],
+                                      [pos for pos in line if pos not in segment]))
+
+    return {
+        'units': units,
+        'peers': peers,
+        'intersections': intersections,
+        'all_candidates': (1 << size) - 1,
+    }
+
+
+def luby(i):
+    """
+    Get the i-th term (from 1) of the Luby restart sequence 1, 1, 2, 1, 1, 2, 4, 1, 1, 2, ...
+
+    Parameters:
+     - i (int): Index of the term, starting at 1.
+
+    Returns:
+     - int: The term.
+    """
+    while True:
+        k = i.bit_length()
+        if i == (1 << k) - 1:
+            return 1 << (k - 1)
+        i -= (1 << (k - 1)) - 1
+
+
+def place(values, candidates, layout, pos, value, singles):
+    """
+    Place a value in a cell and remove it from the candidates of the cell's peers.
+
+    Parameters:
+     - values (list of int): Cell values, updated in place.
+     - candidates (list of int): Candidate bitsets, updated in place.
+     - layout (dict): The grid layout from `build_layout`.
+     - pos (int): Position of the cell.
+     - value (int): The value to place.
+     - singles (list of int): Empty peers left with one or no candidates are appended to it.
+    """
+    values[pos] = value
+    candidates[pos] = 0
+    eliminate(candidates, layout['peers'][pos], 1 << (value - 1), singles)
+
+
+def eliminate(candidates, cells, mask, singles):
+    """
+    Remove candidate bits from a set of cells.
+
+    Parameters:
+     - candidates (list of int): Candidate bitsets, updated in place.
+     - cells (list of int): Positions of the cells.
+     - mask (int): The candidate bits to remove.
+     - singles (list of int): Cells left with one or no candidates are appended to it.
+
+    Returns:
+     - boolean: True if any candidate was removed.
+    """
+    removed = False
+    for pos in cells:
+        cell_mask = candidates[pos]
+        if cell_mask & mask:
+            cell_mask &= ~mask
+            candidates[pos] = cell_mask
+            removed = True
+            if cell_mask & (cell_mask - 1) == 0:
+                singles.append(pos)
+    return removed
+
+
+def propagate(values, candidates, layout, singles):
+    """
+    Place naked and hidden singles and remove locked candidates until nothing changes.
+
+    Naked singles are taken from the cells `place` reported, so only cells that changed are looked
+    at. The unit scans for hidden singles and locked candidates only run once no naked singles are
+    pending.
+
+    Parameters:
+     - values (list of int): Cell values, updated in place.
+     - candidates (list of int): Candidate bitsets, updated in place.
+     - layout (dict): The grid layout from `build_layout`.
+     - singles (list of int): Cells left with one or no candidates, consumed.
+
+    Returns:
+     - boolean: False if a contradiction was found, True otherwise.
+    """
+    all_candidates = layout['all_candidates']
+    while True:
+        # Naked singles, a cell with one candidate left
+        while singles:
+            pos = singles.pop()
+            if values[pos]:
+                continue
+            mask = candidates[pos]
+            if mask == 0:
+                return False
+            place(values, candidates, layout, pos, mask.bit_length(), singles)
+
+        # Hidden singles, a value with one possible cell left in a unit
+        for unit in layout['units']:
+            seen_once, seen_more, placed = 0, 0, 0
+            for pos in unit:
+                mask = candidates[pos]
+                seen_more |= seen_once & mask
+                seen_once |= mask
+                if values[pos]:
+                    placed |= 1 << (values[pos] - 1)
+            if (seen_once | placed) != all_candidates:
+                return False
+            hidden = seen_once & ~seen_more
+            while hidden:
+                bit = hidden & -hidden
+                hidden ^= bit
+                cells = [pos for pos in unit if candidates[pos] & bit]
+                if len(cells) != 1:
+                    return False
+                place(values, candidates, layout, cells[0], bit.bit_length(), singles)
+            if singles:
+                break
+        else:
+            # Locked candidates, a value confined to where a box and a line cross
+            changed = False
+            for segment, box_rest, line_rest in layout['intersections']:
+                segment_mask = 0
+                for pos in segment:
+                    segment_mask |= candidates[pos]
+                if not segment_mask:
+                    continue
+                box_mask, line_mask = 0, 0
+                for pos in box_rest:
+                    box_mask |= candidates[pos]
+                for pos in line_rest:
+                    line_mask |= candidates[pos]
+                # Values only in the segment within the box leave the line, and vice versa
+                pointing = segment_mask & ~box_mask & line_mask
+                claiming = segment_mask & ~line_mask & box_mask
+                if pointing:
+                    changed |= eliminate(candidates, line_rest, pointing, singles)
+                if claiming:
+                    changed |= eliminate(candidates, box_rest, claiming, singles)
+            if not changed:
+                return True
+
+
+def search(values, candidates, layout, singles, budget):
+    """
+    Solve by propagation, branching on the most constrained cell when propagation stalls.
+
+    Ties between equally constrained cells, and the order of branches, are broken at random so
+    that restarts explore different parts of the search tree.
+
+    Parameters:
+     - values (list of int): Cell values, may be updated in place.
+     - candidates (list of int): Candidate bitsets, may be updated in place.
+     - layout (dict): The grid layout from `build_layout`.
+     - singles (list of int): Cells left with one or no candidates, still to be propagated.
+     - budget (dict): 'nodes' left before giving up on this attempt, and the 'rng' to break ties with.
+
+    Returns:
+     - list of int or None: The solved values, or None if there is no solution.
+
+    Raises:
+     - SearchLimitReached: If the node budget runs out.
+    """
+    budget['nodes'] -= 1
+    if budget['nodes'] < 0:
+        raise SearchLimitReached()
+
+    if not propagate(values, candidates, layout, singles):
+        return None
+
+    best_cells, best_count = [], None
+    for pos, value in enumerate(values):
+        if value == 0:
+            count = bin(candidates[pos]).count('1')
+            if best_count is None or count < best_count:
+                best_cells, best_count = [pos], count
+            elif count == best_count:
+                best_cells.append(pos)
+    if not best_cells:
+        return values  # Every cell is filled
+
+    # Branch on the cell's candidates, or on a value with only two possible cells in a unit,
+    # whichever gives fewer branches
+    branches = []
+    if best_count > 2:
+        branches = find_unit_pair(candidates, layout['units'])
+    if not branches:
+        best_pos = budget['rng'].choice(best_cells)
+        mask = candidates[best_pos]
+        while mask:
+            bit = mask & -mask
+            mask ^= bit
+            branches.append((best_pos, bit.bit_length()))
+    budget['rng'].shuffle(branches)
+
+    for pos, value in branches:
+        next_values = values[:]
+        next_candidates = candidates[:]
+        next_singles = []
+        place(next_values, next_candidates, layout, pos, value, next_singles)
+        solution = search(next_values, next_candidates, layout, next_singles, budget)
+        if solution is not None:
+            return solution
+
+    return None
+
+
+def find_unit_pair(candidates, units):
+    """
+    Find a value that can only go in two cells of some unit.
+
+    Parameters:
+     - candidates (list of int): Candidate bitsets.
+     - units (list of list of int): Rows, columns and boxes.
+
+    Returns:
+     - list of tuple: The two (position, value) placements to branch on, or an empty list if no
+       unit has such a value.
+    """
+    for unit in units:
+        seen_once, seen_twice, seen_more = 0, 0, 0
+        for pos in unit:
+            mask = candidates[pos]
+            seen_more |= seen_twice & mask
+            seen_twice |= seen_once & mask
+            seen_once |= mask
+        pairs = seen_twice & ~seen_more
+        if pairs:
+            bit = pairs & -pairs
+            return [(pos, bit.bit_length()) for pos in unit if candidates[pos] & bit]
+    return []
@@ -0,0 +1,131 @@
+# This module handles reading and writing sudoku grids in their plain text and binary forms
+import os
+import numpy as np
+
+
+def load_grids(file_name):
+    """
+    Load a corpus of sudoku grids from a text file.
+
+    Each non-empty line of the file holds one puzzle as 81 characters, row by row, where
+    '0' or '.' marks an empty cell. Lines starting with '#' are treated as comments.
+
+    Parameters:
+     - file_name (str): The path to the grid corpus file.
+
+    Returns:
+     - list of numpy.ndarray: The 9x9 grids found in the file.
+
+    Raises:
+     - FileNotFoundError: If the file does not exist.
+     - ValueError: If a line cannot be parsed as a sudoku grid.
+    """
+    if not os.path.exists(file_name):
+        raise FileNotFoundError(f"The file {file_name} does not exist.")
+
+    grids = []
+    with open(file_name) as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                grids.append(string_to_grid(line))
+            except ValueError as e:
+                raise ValueError(f"Invalid grid on line {line_number} of {file_name}: {e}")
+
+    return grids
+
+
+def string_to_grid(grid_string):
+    """
+    Convert an 81 character string into a 9x9 sudoku grid.
+
+    Parameters:
+     - grid_string (str): The cells of the grid row by row, '0' or '.' for empty cells.
+
+    Returns:
+     - numpy.ndarray: 9x9 integer array representing the grid.
+
+    Raises:
+     - ValueError: If the string does not describe 81 cells of digits.
+    """
+    grid_string = grid_string.replace('.', '0')
+    if len(grid_string) != 81 or not grid_string.isdigit():
+        raise ValueError("expected 81 digits")
+
+    return np.array([int(c) for c in grid_string], dtype=int).reshape(9, 9)
+
+
+def grid_to_string(grid):
+    """
+    Convert a 9x9 sudoku grid into its 81 character string form.
+
+    Parameters:
+     - grid (numpy.ndarray): 9x9 array representing the grid, 0 for empty cells.
+
+    Returns:
+     - str: The cells of the grid row by row.
+    """
+    return ''.join(str(int(value)) for value in np.asarray(grid).flatten())
+
+
+# Binary wire formats for 9x9 grids, several grids are sent back to back for batch calls
+GRID_MEDIA_TYPE = 'application/vnd.sudoku.grid'  # 81 bytes per grid, one byte per cell
+NIBBLE_GRID_MEDIA_TYPE = 'application/vnd.sudoku.grid+nibble'  # 41 bytes per grid, two cells per byte
+GRID_BYTES = {GRID_MEDIA_TYPE: 81, NIBBLE_GRID_MEDIA_TYPE: 41}
+
+
+def decode_grids(data, media_type=GRID_MEDIA_TYPE):
+    """
+    Decode concatenated binary grids into a numpy array without going through Python ints.
+
+    In the 81 byte format each byte is a cell, row by row. In the 41 byte nibble format each byte
+    holds two cells, the first in its high 4 bits, and the low 4 bits of the last byte are unused.
+
+    Parameters:
+     - data (bytes): The encoded grids.
+     - media_type (str): GRID_MEDIA_TYPE or NIBBLE_GRID_MEDIA_TYPE.
+
+    Returns:
+     - numpy.ndarray: A uint8 array of shape (number of grids, 9, 9), 0 for empty cells. For the 81
+       byte format it is a read-only view of `data`.
+
+    Raises:
+     - ValueError: If the data is not a whole number of grids or holds values outside 0-9.
+    """
+    grid_bytes = GRID_BYTES[media_type]
+    if not data or len(data) % grid_bytes:
+        raise ValueError(f"Expected a multiple of {grid_bytes} bytes, got {len(data)}")
+
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if media_type == NIBBLE_GRID_MEDIA_TYPE:
+        raw = raw.reshape(-1, grid_bytes)
+        cells = np.empty((raw.shape[0], 2 * grid_bytes), dtype=np.uint8)
+        np.right_shift(raw, 4, out=cells[:, 0::2])
+        np.bitwise_and(raw, 0x0F, out=cells[:, 1::2])
+        raw = cells[:, :81]
+
+    grids = raw.reshape(-1, 9, 9)
+    if grids.max() > 9:
+        raise ValueError("Sudoku grid values must be between 0 and 9")
+    return grids
+
+
+def encode_grids(grids, media_type=GRID_MEDIA_TYPE):
+    """
+    Encode 9x9 grids into concatenated binary grids.
+
+    Parameters:
+     - grids (numpy.ndarray): A 9x9 grid or an array of shape (number of grids, 9, 9) with values 0-9.
+     - media_type (str): GRID_MEDIA_TYPE or NIBBLE_GRID_MEDIA_TYPE.
+
+    Returns:
+     - bytes: The encoded grids, 81 or 41 bytes each.
+    """
+    cells = np.asarray(grids, dtype=np.uint8).reshape(-1, 81)
+    if media_type == NIBBLE_GRID_MEDIA_TYPE:
+        padded = np.zeros((cells.shape[0], 82), dtype=np.uint8)
+        padded[:, :81] = cells
+        cells = (padded[:, 0::2] << 4) | padded[:, 1::2]
+    return cells.tobytes()
@@ -0,0 +1,158 @@
+# This module finds the next logical step in a sudoku, for giving the user hints without a full search
+from .candidates import (UNITS, ROWS, COLUMNS, BOXES, CELL_UNITS, MASK_COUNTS, value_bit, bit_values, grid_values,
+                         find_conflicts, compute_candidates)
+
+# Techniques from cheapest to most advanced, used to rank how hard a deduction is
+TECHNIQUES = ['naked_single', 'hidden_single', 'pointing_pair', 'box_line_reduction', 'naked_pair']
+
+
+#  Main function
+def find_hint(grid):
+    """
+    Find the cheapest logical deduction that places a value in the sudoku.
+
+    Candidates are propagated with bitmasks. If no single can be placed straight away, candidate
+    eliminations (pointing pairs, box/line reductions and naked pairs) are applied, cheapest first,
+    until one can. The eliminations needed are returned with the placement.
+
+    Parameters:
+     - grid (numpy.ndarray): 9x9 sudoku grid, 0 for empty cells. It is not modified.
+
+    Returns:
+     - dict or None: The hint, with 'technique' (the hardest technique needed), 'row', 'col' and
+       'value' of the placement, and 'steps' listing the eliminations that lead to it. None if the
+       grid is already complete or cannot be progressed without search.
+
+    Raises:
+     - ValueError: If the grid is malformed, breaks the sudoku rules, or has no solution.
+    """
+    values = grid_values(grid)
+    if find_conflicts(values):
+        raise ValueError("Invalid sudoku grid")
+
+    candidates = compute_candidates(values)
+    steps = []
+
+    while True:
+        empty_cells = [pos for pos in range(81) if values[pos] == 0]
+        if not empty_cells:
+            return None
+        if any(candidates[pos] == 0 for pos in empty_cells):
+            raise ValueError("Could not solve sudoku")
+
+        placement = find_naked_single(values, candidates) or find_hidden_single(values, candidates)
+        if placement is not None:
+            technique, pos, value = placement
+            hardest = max([technique] + [step['technique'] for step in steps], key=TECHNIQUES.index)
+            return {
+                'technique': hardest,
+                'row': pos // 9,
+                'col': pos % 9,
+                'value': value,
+                'steps': steps,
+            }
+
+        step = (find_pointing_pair(values, candidates)
+                or find_box_line_reduction(values, candidates)
+                or find_naked_pair(values, candidates))
+        if step is None:
+            return None
+
+        technique, value_mask, cells, eliminations = step
+        for pos in eliminations:
+            candidates[pos] &= ~value_mask
+        steps.append({
+            'technique': technique,
+            'values': bit_values(value_mask),
+            'cells': [[pos // 9, pos % 9] for pos in cells],
+            'eliminations': [[pos // 9, pos % 9] for pos in eliminations],
+        })
+
+
+# Placements, each returns (technique, position, value) or None
+def find_naked_single(values, candidates):
+    """
+    Find an empty cell with exactly one candidate left.
+    """
+    for pos in range(81):
+        mask = candidates[pos]
+        if values[pos] == 0 and mask & (mask - 1) == 0:
+            return 'naked_single', pos, mask.bit_length()
+    return None
+
+
+def find_hidden_single(values, candidates):
+    """
+    Find a value that only one cell of a unit can hold.
+    """
+    for unit in UNITS:
+        for value in range(1, 10):
+            bit = value_bit(value)
+            cells = [pos for pos in unit if candidates[pos] & bit]
+            if len(cells) == 1:
+                return 'hidden_single', cells[0], value
+    return None
+
+
+# Eliminations, each returns (technique, value mask, cells, eliminated cells) or None
+def find_pointing_pair(values, candidates):
+    """
+    Find a value confined to one row or column within a box, so it can be removed from the
+    rest of that row or column.
+    """
+    for box in BOXES:
+        for value in range(1, 10):
+            bit = value_bit(value)
+            cells = [pos for pos in box if candidates[pos] & bit]
+            if len(cells) < 2:
+                continue
+            for line_index in (0, 1):
+                lines = {CELL_UNITS[pos][line_index] for pos in cells}
+                if len(lines) != 1:
+                    continue
+                line = UNITS[lines.pop()]
+                eliminations = [pos for pos in line if pos not in box and candidates[pos] & bit]
+                if eliminations:
+                    return 'pointing_pair', bit, cells, eliminations
+    return None
+
+
+def find_box_line_reduction(values, candidates):
+    """
+    Find a value confined to one box within a row or column, so it can be removed from the
+    rest of that box.
+    """
+    for line in ROWS + COLUMNS:
+        for value in range(1, 10):
+            bit = value_bit(value)
+            cells = [pos for pos in line if candidates[pos] & bit]
+            if len(cells) < 2:
+                continue
+            boxes = {CELL_UNITS[pos][2] for pos in cells}
+            if len(boxes) != 1:
+                continue
+            box = UNITS[boxes.pop()]
+            eliminations = [pos for pos in box if pos not in line and candidates[pos] & bit]
+            if eliminations:
+                return 'box_line_reduction', bit, cells, eliminations
+    return None
+
+
+def find_naked_pair(values, candidates):
+    """
+    Find two cells of a unit sharing the same two candidates, so those values can be removed
+    from the rest of the unit.
+    """
+    for unit in UNITS:
+        pairs = {}
+        for pos in unit:
+            mask = candidates[pos]
+            if MASK_COUNTS[mask] == 2:
+                pairs.setdefault(mask, []).append(pos)
+        for mask, cells in pairs.items():
+            if len(cells) != 2:
+                continue
+            eliminations = [pos for pos in unit if pos not in cells and candidates[pos] & mask]
+            if eliminations:
+                return 'naked_pair', mask, cells, eliminations
+    return None
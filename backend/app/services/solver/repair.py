@@ -0,0 +1,147 @@
+# This module repairs recognised grids that cannot be solved, using the digit model's alternative readings
+import itertools
+import math
+import numpy as np
+from .candidates import grid_values, find_conflicts, compute_candidates, search_solutions, SearchLimitReached
+
+# Search nodes allowed when checking whether one candidate repair has a unique solution
+REPAIR_SEARCH_NODES = 2000
+
+
+#  Main function
+def repair_grid(grid, positions, digits, probabilities, max_changes=2, max_suspects=12, max_attempts=500,
+                min_probability=0.01, max_nodes=REPAIR_SEARCH_NODES):
+    """
+    Repair a recognised grid that breaks the sudoku rules or has no solution.
+
+    The recognised cells most likely to be misread, those in conflict first and then those the
+    model was least confident about, are the suspects. Replacing suspects with their alternative
+    readings is tried in order of how much less probable the whole grid becomes, up to
+    `max_changes` cells at a time. Each attempt is rejected straight away if it still breaks the
+    sudoku rules, and otherwise accepted if a bounded candidate search finds exactly one solution.
+
+    Parameters:
+     - grid (numpy.ndarray): 9x9 recognised grid, 0 for empty cells. It is not modified.
+     - positions (list of int): Positions (row * 9 + col) of the recognised cells.
+     - digits (numpy.ndarray): (len(positions), k) array of the model's k most probable digits for
+       each recognised cell, most probable first, from `predict_cell_candidates`.
+     - probabilities (numpy.ndarray): (len(positions), k) array of the probabilities of those digits.
+     - max_changes (int): Most cells changed in one repair.
+     - max_suspects (int): Number of recognised cells considered for changing.
+     - max_attempts (int): Most repairs checked before giving up.
+     - min_probability (float): Alternative readings less probable than this are never used, so an
+       unlikely digit is not forced in just because it happens to give a valid grid.
+     - max_nodes (int): Search nodes allowed for checking one repair.
+
+    Returns:
+     - tuple of (numpy.ndarray, list of dict):
+        - The repaired grid, or a copy of the original grid if it is fine or could not be repaired.
+        - The changed cells, each with 'row', 'col', 'from' and 'to' digits and the model's
+          'probability' for the new digit. Empty if nothing was changed.
+
+    Raises:
+     - ValueError: If the grid is malformed or the predictions do not match the positions.
+    """
+    values = grid_values(grid)
+    if len(positions) != len(digits) or len(digits) != len(probabilities):
+        raise ValueError("Predictions must match the recognised cell positions")
+
+    conflicts = find_conflicts(values)
+    if not conflicts:
+        try:
+            # A grid with any solution is left alone. A misread digit almost always leaves no solution,
+            # while an ambiguous puzzle, or a hard one that needs a larger budget, may be read correctly.
+            if search_solutions(values, compute_candidates(values), limit=1, max_nodes=max_nodes * 10):
+                return np.array(grid, copy=True), []
+        except SearchLimitReached:
+            return np.array(grid, copy=True), []
+
+    for changes in rank_repairs(positions, digits, probabilities, conflicts, max_changes, max_suspects,
+                                max_attempts, min_probability):
+        repaired = list(values)
+        for pos, digit, _ in changes:
+            repaired[pos] = digit
+        if find_conflicts(repaired):
+            continue
+        try:
+            if not is_uniquely_solvable(repaired, max_nodes):
+                continue
+        except SearchLimitReached:
+            continue
+
+        repaired_grid = np.array(repaired, dtype=int).reshape(9, 9)
+        changed_cells = [{
+            'row': pos // 9,
+            'col': pos % 9,
+            'from': values[pos],
+            'to': digit,
+            'probability': float(probability),
+        } for pos, digit, probability in changes]
+        return repaired_grid, changed_cells
+
+    return np.array(grid, copy=True), []
+
+
+# Supplementary functions
+def is_uniquely_solvable(values, max_nodes):
+    """
+    Check that a grid has exactly one solution.
+
+    Parameters:
+     - values (list of int): The 81 cell values, 0 for empty cells.
+     - max_nodes (int): Search nodes allowed.
+
+    Returns:
+     - boolean: True if the grid has exactly one solution.
+
+    Raises:
+     - SearchLimitReached: If the search did not finish within `max_nodes` nodes.
+    """
+    return len(search_solutions(values, compute_candidates(values), limit=2, max_nodes=max_nodes)) == 1
+
+
+def rank_repairs(positions, digits, probabilities, conflicts, max_changes, max_suspects, max_attempts,
+                 min_probability):
+    """
+    List the possible repairs, most probable first.
+
+    A repair's cost is the drop in log probability of the recognised grid, summed over the cells
+    it changes, so a confident reading is only overridden if cheaper repairs all failed.
+
+    Parameters:
+     - positions (list of int): Positions of the recognised cells.
+     - digits (numpy.ndarray): The k most probable digits of each recognised cell.
+     - probabilities (numpy.ndarray): Their probabilities.
+     - conflicts (list of int): Positions of cells that break the sudoku rules.
+     - max_changes (int): Most cells changed in one repair.
+     - max_suspects (int): Number of recognised cells considered for changing.
+     - max_attempts (int): Most repairs returned.
+     - min_probability (float): Least probability of an alternative reading to be used.
+
+    Returns:
+     - list of tuple: Up to `max_attempts` repairs, each a tuple of (position, digit, probability)
+       changes.
+    """
+    conflicting = set(conflicts)
+    order = sorted(range(len(positions)),
+                   key=lambda i: (positions[i] not in conflicting, probabilities[i][0]))
+
+    suspects = []
+    for i in order[:max_suspects]:
+        alternatives = []
+        for digit, probability in zip(digits[i][1:], probabilities[i][1:]):
+            if probability >= min_probability:
+                cost = math.log(probabilities[i][0]) - math.log(probability)
+                alternatives.append((cost, positions[i], int(digit), probability))
+        if alternatives:
+            suspects.append(alternatives)
+
+    repairs = []
+    for count in range(1, max_changes + 1):
+        for chosen in itertools.combinations(suspects, count):
+            for alternatives in itertools.product(*chosen):
+                cost = sum(alternative[0] for alternative in alternatives)
+                repairs.append((cost, tuple(alternative[1:] for alternative in alternatives)))
+
+    repairs.sort(key=lambda repair: repair[0])
+    return [changes for _, changes in repairs[:max_attempts]]
@@ -0,0 +1,140 @@
+# This module keeps the candidate state of a sudoku between edits, so small changes are cheap to re-check
+import numpy as np
+from .candidates import CELL_UNITS, PEERS, ALL_CANDIDATES, value_bit, grid_values, search_solutions
+
+
+class SolvingSession:
+    """
+    Incrementally maintained candidate state of a sudoku being edited.
+
+    For every unit the number of cells holding each value is counted, which gives the values used
+    by the unit and whether it holds a duplicate. Changing a cell only updates the counts of its
+    three units and recomputes the candidates of the cell and its 20 peers, instead of rebuilding
+    the state of the whole grid. The last solution found is kept and returned again while it still
+    agrees with every filled cell.
+
+    Parameters:
+    - grid (numpy.ndarray): 9x9 sudoku grid, 0 for empty cells. It is copied.
+    """
+
+    def __init__(self, grid):
+        self.values = grid_values(grid)
+        self.unit_counts = [[0] * 10 for _ in range(27)]
+        self.used = [0] * 27
+        self.duplicate_units = set()
+        self.solution = None
+
+        for pos, value in enumerate(self.values):
+            if value:
+                self._add(pos, value)
+        self.candidates = [self._cell_candidates(pos) for pos in range(81)]
+
+    def set_cell(self, row, col, value):
+        """
+        Place, change or clear (value 0) a single cell.
+
+        Parameters:
+        - row (int): Row index of the cell.
+        - col (int): Column index of the cell.
+        - value (int): The new value, 0 to clear the cell.
+
+        Raises:
+        - ValueError: If the cell or value is out of range.
+        """
+        if not (0 <= row < 9 and 0 <= col < 9):
+            raise ValueError("Cell must be within the 9x9 grid")
+        if not 0 <= value <= 9:
+            raise ValueError("Sudoku grid values must be between 0 and 9")
+
+        pos = row * 9 + col
+        old_value = self.values[pos]
+        if old_value == value:
+            return
+
+        if old_value:
+            self._remove(pos, old_value)
+        self.values[pos] = value
+        if value:
+            self._add(pos, value)
+
+        # Only the changed cell and its peers can have different candidates
+        self.candidates[pos] = self._cell_candidates(pos)
+        for peer in PEERS[pos]:
+            self.candidates[peer] = self._cell_candidates(peer)
+
+    def conflicts(self):
+        """
+        Find the cells that share a value with another cell in the same unit.
+
+        Returns:
+        - list of int: Sorted positions of the conflicting cells.
+        """
+        conflicts = set()
+        for pos, value in enumerate(self.values):
+            if value and any(self.unit_counts[unit][value] > 1 for unit in CELL_UNITS[pos]):
+                conflicts.add(pos)
+        return sorted(conflicts)
+
+    def is_valid(self):
+        """
+        Check that no unit holds a duplicate and every empty cell still has a candidate.
+
+        Returns:
+        - bool: True if the grid is consistent so far.
+        """
+        if self.duplicate_units:
+            return False
+        return all(self.values[pos] or self.candidates[pos] for pos in range(81))
+
+    def solve(self):
+        """
+        Solve the grid from the current candidate state.
+
+        Returns:
+        - numpy.ndarray: The solved 9x9 grid.
+
+        Raises:
+        - ValueError: If the grid cannot be solved.
+        """
+        if self.solution is None or any(value and value != self.solution[pos]
+                                        for pos, value in enumerate(self.values)):
+            if not self.is_valid():
+                raise ValueError("Could not solve sudoku")
+            solutions = search_solutions(self.values, self.candidates, limit=1)
+            if not solutions:
+                raise ValueError("Could not solve sudoku")
+            self.solution = solutions[0]
+
+        return np.array(self.solution, dtype=int).reshape(9, 9)
+
+    def grid(self):
+        """
+        Get the current grid.
+
+        Returns:
+        - numpy.ndarray: The 9x9 grid, 0 for empty cells.
+        """
+        return np.array(self.values, dtype=int).reshape(9, 9)
+
+    def _add(self, pos, value):
+        for unit in CELL_UNITS[pos]:
+            counts = self.unit_counts[unit]
+            counts[value] += 1
+            self.used[unit] |= value_bit(value)
+            if counts[value] > 1:
+                self.duplicate_units.add(unit)
+
+    def _remove(self, pos, value):
+        for unit in CELL_UNITS[pos]:
+            counts = self.unit_counts[unit]
+            counts[value] -= 1
+            if counts[value] == 0:
+                self.used[unit] &= ~value_bit(value)
+            if not any(count > 1 for count in counts):
+                self.duplicate_units.discard(unit)
+
+    def _cell_candidates(self, pos):
+        if self.values[pos]:
+            return 0
+        row, col, box = CELL_UNITS[pos]
+        return ALL_CANDIDATES & ~(self.used[row] | self.used[col] | self.used[box])
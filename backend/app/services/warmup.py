@@ -0,0 +1,102 @@
+# This module warms a worker up before it takes traffic, so the first request does not pay for lazy initialisation
+import logging
+import os
+import time
+import cv2
+import numpy as np
+import torch
+from .image_processing.image_preprocessor import isolate_sudoku
+from .image_processing.cell_configurator import extract_all_cells
+from .image_processing.cell_preprocessor import preprocess_and_select_cells, cell_buffer, find_candidate_cells
+from .image_processing.digit_recognition.tools import load_model, predict_cell_candidates
+from .image_processing.synthetic import generate_puzzle, render_puzzle_image
+
+# Photo pushed through the pipeline during warm-up, a synthetic one is rendered if it is not deployed
+SAMPLE_IMAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data', 'sudoku_tests',
+                                 'sudoku_test2.png')
+
+# Set to 1 to replace the model with a traced and frozen TorchScript graph
+TRACE_MODEL_ENV = 'SUDOKU_TRACE_MODEL'
+
+# Batch sizes run through the model during warm-up, puzzles have around 20 to 35 givens
+WARM_UP_BATCH_SIZES = (1, 17, 25, 35, 81)
+# Number of cells in the example input the model is traced with, the traced graph accepts any batch size
+TRACE_BATCH_SIZE = 81
+
+
+#  Main function
+def warm_up(trace=None, batch_sizes=WARM_UP_BATCH_SIZES, sample_image_path=SAMPLE_IMAGE_PATH):
+    """
+    Load the model and run every stage of the image pipeline once, so their lazy setup is done.
+
+    PyTorch picks its kernels on the first forward pass of each input shape, and OpenCV sets up
+    its thread pool and lookup tables on first use, so a sample photo is pushed through the
+    pipeline and the model is run at the common batch sizes before the worker reports ready.
+
+    Parameters:
+     - trace (bool, optional): Trace the model into a frozen TorchScript graph. If None, it is
+       enabled by setting the SUDOKU_TRACE_MODEL environment variable to 1.
+     - batch_sizes (tuple of int): Numbers of cells to run the model on.
+     - sample_image_path (str): Photo of a sudoku to run through the pipeline.
+
+    Returns:
+     - torch.nn.Module: The warmed up model, ready to serve requests.
+    """
+    start = time.perf_counter()
+    model = load_model()
+    if trace is None:
+        trace = os.environ.get(TRACE_MODEL_ENV) == '1'
+    if trace:
+        model = trace_model(model)
+
+    with torch.no_grad():
+        for batch_size in batch_sizes:
+            model(torch.zeros(batch_size, 1, 28, 28))
+
+    image = load_sample_image(sample_image_path)
+    transformed_image = isolate_sudoku(image)
+    cells = extract_all_cells(transformed_image)
+    filled_cells, _ = preprocess_and_select_cells(cells, out=cell_buffer(),
+                                                  candidate_cells=find_candidate_cells(transformed_image))
+    predict_cell_candidates(model, filled_cells)
+
+    logging.info(f"Warm-up finished in {(time.perf_counter() - start) * 1000:.0f}ms "
+                 f"({'traced' if trace else 'eager'} model)")
+    return model
+
+
+# Supplementary functions
+def trace_model(model):
+    """
+    Trace the model into a frozen TorchScript graph.
+
+    Freezing folds the batch normalisation parameters into constants and removes the Python
+    module overhead from every forward pass. The graph accepts any batch size.
+
+    Parameters:
+     - model (torch.nn.Module): The model in evaluation mode.
+
+    Returns:
+     - torch.jit.ScriptModule: The frozen graph.
+    """
+    with torch.no_grad():
+        traced = torch.jit.trace(model, torch.zeros(TRACE_BATCH_SIZE, 1, 28, 28))
+    return torch.jit.freeze(traced)
+
+
+def load_sample_image(sample_image_path):
+    """
+    Load the warm-up photo, rendering a synthetic puzzle if it is not available.
+
+    Parameters:
+     - sample_image_path (str): Path of the sample photo.
+
+    Returns:
+     - numpy.ndarray: The image in BGR color format.
+    """
+    image = cv2.imread(sample_image_path, cv2.IMREAD_COLOR) if os.path.exists(sample_image_path) else None
+    if image is None:
+        rng = np.random.default_rng(0)
+        puzzle, _ = generate_puzzle(rng)
+        image = render_puzzle_image(puzzle, rng)
+    return image
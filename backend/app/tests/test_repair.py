@@ -0,0 +1,70 @@
+import numpy as np
+from services.solver.grid_io import string_to_grid
+from services.solver.repair import repair_grid
+
+# A puzzle with a unique solution, as the model would read it from a clean photo
+PUZZLE = string_to_grid('530070000600195000098000060800060003400803001700020006060000280000419005000080079')
+
+
+def predictions(grid, overrides=None):
+    """
+    Build confident top-3 model readings of the filled cells, with some cells' readings replaced.
+    """
+    overrides = overrides or {}
+    positions = [int(pos) for pos in np.flatnonzero(grid)]
+    digits, probabilities = [], []
+    for pos in positions:
+        value = int(grid.flat[pos])
+        reading = overrides.get(pos, ([value, value % 9 + 1, (value + 1) % 9 + 1], [0.998, 0.001, 0.001]))
+        digits.append(reading[0])
+        probabilities.append(reading[1])
+    return positions, np.array(digits), np.array(probabilities)
+
+
+def test_correct_grid_is_left_unchanged():
+    # Uncertain readings whose alternatives also fit the rules must not be swapped in a solvable grid
+    uncertain = {}
+    for pos in (4, 13, 31, 60, 80):
+        value = int(PUZZLE.flat[pos])
+        uncertain[pos] = ([value, value % 9 + 1, (value + 1) % 9 + 1], [0.55, 0.4, 0.05])
+
+    repaired, changed = repair_grid(PUZZLE, *predictions(PUZZLE, uncertain))
+
+    assert changed == []
+    assert np.array_equal(repaired, PUZZLE)
+
+
+def test_correct_grid_with_several_solutions_is_left_unchanged():
+    # Two fewer givens leave several solutions, which is no sign of a misread
+    ambiguous = string_to_grid('530070000600195000098000000800060003400803001700020006060000080000419005000080079')
+    uncertain = {55: ([6, 3, 4], [0.6, 0.35, 0.05])}
+
+    repaired, changed = repair_grid(ambiguous, *predictions(ambiguous, uncertain))
+
+    assert changed == []
+    assert np.array_equal(repaired, ambiguous)
+
+
+def test_single_misread_digit_is_repaired():
+    # The 5 in the top left is read as a 6, which clashes with the 6 below it
+    misread = PUZZLE.copy()
+    misread[0, 0] = 6
+    readings = {0: ([6, 5, 8], [0.6, 0.35, 0.05])}
+
+    repaired, changed = repair_grid(misread, *predictions(misread, readings))
+
+    assert np.array_equal(repaired, PUZZLE)
+    assert changed == [{'row': 0, 'col': 0, 'from': 6, 'to': 5, 'probability': 0.35}]
+
+
+def test_unrepairable_grid_is_returned_unchanged():
+    # None of the misread cell's alternatives fit, and every other reading is certain
+    misread = PUZZLE.copy()
+    misread[0, 0] = 6
+    readings = {0: ([6, 3, 7], [0.6, 0.35, 0.05])}
+
+    repaired, changed = repair_grid(misread, *predictions(misread, readings))
+
+    assert changed == []
+    assert np.array_equal(repaired, misread)
+    assert repaired is not misread
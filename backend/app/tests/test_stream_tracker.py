@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from services.image_processing.digit_recognition.tools import load_model
+from services.image_processing.stream_tracker import StreamSession
+from services.image_processing.synthetic import generate_puzzle, render_puzzle_image
+
+
+@pytest.fixture(scope='module')
+def model():
+    return load_model()
+
+
+@pytest.fixture(scope='module')
+def board_frame():
+    rng = np.random.default_rng(0)
+    puzzle, _ = generate_puzzle(rng)
+    return puzzle, render_puzzle_image(puzzle, rng)
+
+
+def blank_frame():
+    return np.full((600, 600, 3), 255, dtype=np.uint8)
+
+
+def test_frame_without_board_is_not_found(model):
+    session = StreamSession(model)
+
+    result = session.process_frame(blank_frame())
+
+    assert not result['found']
+    assert not result['tracked']
+    assert session.corners is None
+
+
+def test_lost_board_forgets_tracking_state(model, board_frame):
+    puzzle, image = board_frame
+    session = StreamSession(model)
+
+    assert session.process_frame(image)['found']
+    result = session.process_frame(blank_frame())
+    assert not result['found']
+    assert session.corners is None and session.previous_gray is None
+
+    # The board coming back into view is found again by a full detection, not tracked from stale corners
+    result = session.process_frame(image)
+    assert result['found'] and not result['tracked']
+    assert np.array_equal(result['grid'], puzzle)